@@ -0,0 +1,156 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+from db import update_account_status
+from log_config import logger
+
+
+class AccountPool:
+    # Каждый аккаунт обслуживает не больше одной отправки одновременно.
+    # Свободные аккаунты лежат в очереди: слева тот, кто простаивает дольше всех.
+    # Аккаунты во FloodWait в очередь не попадают и ждут в куче по времени окончания ограничения.
+
+    def __init__(self, clients=()):
+        self._clients = list(clients)
+        self._members = set(self._clients)
+        self._idle = deque(self._clients)
+        self._busy = set()
+        self._waiters = []
+        self._cooling = []          # [(ready_at, seq, client)]
+        self._cooling_until = {}    # {client: ready_at}
+        self._seq = itertools.count()
+        self._timer = None
+        self._status_tasks = set()
+
+    @property
+    def clients(self):
+        return list(self._clients)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __contains__(self, client):
+        return client in self._members
+
+    def ready_count(self):
+        self._revive_due()
+        return len(self._clients) - len(self._cooling_until)
+
+    def is_busy(self, client):
+        return client in self._busy
+
+    def cooling_until(self, client):
+        return self._cooling_until.get(client)
+
+    def add(self, client):
+        if client in self._members:
+            return
+        self._clients.append(client)
+        self._members.add(client)
+        self._idle.append(client)
+        self._wake()
+
+    def remove(self, client):
+        if client not in self._members:
+            return
+        self._members.discard(client)
+        self._clients.remove(client)
+        self._cooling_until.pop(client, None)
+        try:
+            self._idle.remove(client)
+        except ValueError:
+            pass
+        self._wake()
+
+    def cool_down(self, client, seconds, persist=True):
+        if client not in self._members:
+            return
+        ready_at = time.time() + seconds
+        self._cooling_until[client] = ready_at
+        heapq.heappush(self._cooling, (ready_at, next(self._seq), client))
+        try:
+            self._idle.remove(client)
+        except ValueError:
+            pass
+        self._arm_timer()
+        if persist:
+            self._write_status(client, 'flood_wait', ready_at)
+
+    async def acquire(self, exclude=()):
+        # None — все готовые аккаунты пула уже были испробованы (exclude)
+        while True:
+            self._revive_due()
+            for client in self._idle:
+                if client not in exclude:
+                    self._idle.remove(client)
+                    self._busy.add(client)
+                    return client
+
+            if not any(client not in exclude and client not in self._cooling_until for client in self._clients):
+                return None
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+    def release(self, client):
+        self._busy.discard(client)
+        if client in self._members and client not in self._cooling_until:
+            self._idle.append(client)
+        self._wake()
+
+    async def wait_released(self, client):
+        while client in self._busy:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+    def _revive_due(self):
+        now = time.time()
+        revived = False
+        while self._cooling and self._cooling[0][0] <= now:
+            ready_at, _, client = heapq.heappop(self._cooling)
+            # Запись устарела: аккаунт удален или получил новый FloodWait
+            if self._cooling_until.get(client) != ready_at:
+                continue
+            del self._cooling_until[client]
+            # После ожидания аккаунт простаивал дольше всех — ставим его в начало очереди
+            self._idle.appendleft(client)
+            self._write_status(client, 'active')
+            logger.info(f"Account {client.phone_number} is ready again after FloodWait.")
+            revived = True
+        if revived:
+            self._wake()
+        self._arm_timer()
+
+    def _arm_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._cooling and self._cooling_until.get(self._cooling[0][2]) != self._cooling[0][0]:
+            heapq.heappop(self._cooling)
+        if self._cooling:
+            loop = asyncio.get_running_loop()
+            delay = max(0, self._cooling[0][0] - time.time())
+            self._timer = loop.call_later(delay, self._revive_due)
+
+    def _write_status(self, client, status, flood_until=None):
+        task = asyncio.create_task(self._persist_status(client.phone_number, status, flood_until))
+        self._status_tasks.add(task)
+        task.add_done_callback(self._status_tasks.discard)
+
+    @staticmethod
+    async def _persist_status(phone, status, flood_until):
+        try:
+            await update_account_status(phone, status, flood_until)
+        except Exception as e:
+            logger.error(f"Failed to save status '{status}' for {phone}: {e}")
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
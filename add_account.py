@@ -1,18 +1,118 @@
+import argparse
 import asyncio
+from pathlib import Path
 
 from pyrogram import Client
-import aiomysql
 
-from env_loader import DB_PORT, DB_HOST, DB_USER, DB_PASS, DB_NAME, API_ID, API_HASH
+from db import init_pool, close_pool, execute_query, save_new_account, get_existing_phones, save_new_accounts
+from env_loader import API_ID, API_HASH, CLIENT_START_CONCURRENCY
 from log_config import logger
 
-DB_CONFIG = {
-    'host': DB_HOST,
-    'port': DB_PORT,
-    'user': DB_USER,
-    'password': DB_PASS,
-    'db': DB_NAME
-}
+
+class ImportItem:
+    def __init__(self, origin, session_string=None, session_file=None):
+        self.origin = origin              # файл (и строка), откуда взята сессия — для отчета
+        self.session_string = session_string
+        self.session_file = session_file  # Path к .session (формат Pyrogram)
+        self.phone = None
+        self.name = None
+        self.status = None                # added / duplicate / invalid
+        self.error = None
+
+
+def collect_sessions(path):
+    # Файл: по одной session string в строке. Папка: *.session Pyrogram и такие же текстовые *.txt
+    path = Path(path)
+    files = sorted(path.iterdir()) if path.is_dir() else [path]
+    items = []
+    for file in files:
+        if file.suffix == ".session":
+            items.append(ImportItem(file.name, session_file=file))
+        elif file.is_file() and (file == path or file.suffix == ".txt"):
+            for number, line in enumerate(file.read_text(encoding="utf-8").splitlines(), 1):
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    items.append(ImportItem(f"{file.name}:{number}", session_string=line))
+    return items
+
+
+async def validate(item, slots):
+    async with slots:
+        if item.session_file is not None:
+            app = Client(item.session_file.stem, api_id=API_ID, api_hash=API_HASH,
+                         workdir=str(item.session_file.parent))
+        else:
+            app = Client(f"import_{id(item)}", api_id=API_ID, api_hash=API_HASH,
+                         session_string=item.session_string, in_memory=True)
+        try:
+            # connect без start: неавторизованная сессия не должна запрашивать вход в консоли
+            await app.connect()
+            me = await app.get_me()
+            if me.is_bot:
+                raise ValueError("bot session")
+            if not me.phone_number:
+                raise ValueError("phone number is hidden")
+            item.phone = me.phone_number
+            item.name = f"{me.first_name} (@{me.username})"
+            item.session_string = await app.export_session_string()
+        except Exception as e:
+            item.status = "invalid"
+            item.error = str(e) or type(e).__name__
+        finally:
+            try:
+                if app.is_connected:
+                    await app.disconnect()
+            except Exception:
+                pass
+
+
+async def bulk_import(path, concurrency):
+    items = collect_sessions(path)
+    if not items:
+        print(f"Сессии не найдены: {path}")
+        return
+    logger.info(f"Validating {len(items)} sessions (concurrency {concurrency})...")
+
+    slots = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*[validate(item, slots) for item in items])
+
+    valid = [item for item in items if item.status is None]
+    existing = await get_existing_phones({item.phone for item in valid})
+    new_accounts = {}
+    for item in valid:
+        if item.phone in existing or item.phone in new_accounts:
+            item.status = "duplicate"
+        else:
+            item.status = "added"
+            new_accounts[item.phone] = item.session_string
+
+    if new_accounts:
+        await save_new_accounts(new_accounts.items())
+
+    print("\n--- Import summary ---")
+    for item in items:
+        line = f"{item.origin:<40} {item.phone or '-':<16} {item.status}"
+        if item.error:
+            line += f": {item.error}"
+        elif item.name:
+            line += f" — {item.name}"
+        print(line)
+    counts = {status: len([item for item in items if item.status == status])
+              for status in ("added", "duplicate", "invalid")}
+    print(f"\nДобавлено: {counts['added']}, дубликатов: {counts['duplicate']}, невалидных: {counts['invalid']}")
+    if counts['added']:
+        print("Чтобы подключить новые аккаунты к работающему боту, отправьте ему /reload")
+
+
+async def main(args=None):
+    await init_pool()
+    try:
+        if args is not None and args.bulk:
+            await bulk_import(args.bulk, args.concurrency)
+        else:
+            await add_account()
+    finally:
+        await close_pool()
 
 
 async def add_account():
@@ -29,26 +129,22 @@ async def add_account():
             session_string = await app.export_session_string()
             phone = app.me.phone_number
 
-            conn = await aiomysql.connect(**DB_CONFIG)
-            async with conn.cursor() as cur:
-                await cur.execute("SELECT id FROM accounts WHERE phone = %s", (phone,))
-                exists = await cur.fetchone()
-
-                if exists:
-                    logger.warn(f"{phone} account already exists in the database!")
-                else:
-                    await cur.execute(
-                        "INSERT INTO accounts (phone, session_string, status) VALUES (%s, %s, 'active')",
-                        (phone, session_string)
-                    )
-                    await conn.commit()
-                    logger.info(f"{phone} account info was inserted into the database successfully (New MySQL row)!")
+            exists = await execute_query("SELECT id FROM accounts WHERE phone = %s", (phone,), fetch='one')
 
-            conn.close()
+            if exists:
+                logger.warn(f"{phone} account already exists in the database!")
+            else:
+                await save_new_account(phone, session_string)
+                logger.info(f"{phone} account info was inserted into the database successfully (New MySQL row)!")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Добавление аккаунтов в базу")
+    parser.add_argument("--bulk", metavar="PATH",
+                        help="файл с session string (по одной в строке) или папка с .session / .txt")
+    parser.add_argument("--concurrency", type=int, default=CLIENT_START_CONCURRENCY,
+                        help="сколько сессий проверять одновременно")
     try:
-        asyncio.run(add_account())
+        asyncio.run(main(parser.parse_args()))
     except KeyboardInterrupt:
-        print("Скрипт добавления сессий завершил работу. Рекомендуется перезапустить бота...")
\ No newline at end of file
+        print("Скрипт добавления сессий завершил работу. Рекомендуется перезапустить бота...")
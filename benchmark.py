@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+# Бенчмарк не ходит ни в Telegram, ни в MySQL: достаточно любых значений
+os.environ.setdefault("API_ID", "0")
+
+from pyrogram import raw, utils
+from pyrogram.errors import FloodWait, UserDeactivated
+
+import db
+from broadcaster import Broadcaster
+from write_buffer import WriteBuffer
+
+SOURCE = "bench_source"
+SOURCE_CHAT_ID = -1001000000000
+
+
+class FakeChat:
+    def __init__(self, chat_id, username):
+        self.id = chat_id
+        self.username = username
+
+
+class FakeMessage:
+    def __init__(self, msg_id, chat=None, forward_from_message_id=None):
+        self.id = msg_id
+        self.chat = chat
+        self.date = datetime.now(timezone.utc)
+        self.reply_markup = True
+        self.media_group_id = None
+        self.forward_from_message_id = forward_from_message_id
+
+
+class FakeStorage:
+    async def update_peers(self, peers):
+        pass
+
+
+class Stats:
+    def __init__(self):
+        self.due_at = {}    # {chat_link: время по расписанию}
+        self.peers = {}     # {peer_id: chat_link} — после резолва отправка идет по peer_id
+        self.lags = []
+        self.posts = 0
+        self.flood_waits = 0
+        self.dead = 0
+        self.round_trips = 0
+        self.transactions = 0
+
+
+class FakeClient:
+    # Имитация pyrogram.Client: задержка RPC, FloodWait и "мертвые" аккаунты с заданной вероятностью
+
+    _msg_ids = iter(range(1, 10 ** 9))
+
+    def __init__(self, stats, latency, flood_rate, flood_wait, dead_rate):
+        self.stats = stats
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.dead_rate = dead_rate
+        self.is_connected = False
+        self.is_dead = False
+        self.storage = FakeStorage()
+
+    async def _rpc(self):
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+    async def start(self):
+        await self._rpc()
+        self.is_connected = True
+
+    async def stop(self):
+        self.is_connected = False
+
+    async def join_chat(self, chat_link):
+        await self._rpc()
+
+    async def resolve_peer(self, chat_link):
+        channel_id = abs(hash(chat_link)) % 10 ** 9
+        self.stats.peers[utils.get_channel_id(channel_id)] = chat_link
+        return raw.types.InputPeerChannel(channel_id=channel_id, access_hash=1)
+
+    async def get_chat_history(self, chat_id, limit=0):
+        await self._rpc()
+        chat = FakeChat(SOURCE_CHAT_ID, SOURCE)
+        for msg_id in range(limit, 0, -1):
+            yield FakeMessage(msg_id, chat)
+
+    async def _send(self, chat_id, message_ids):
+        await self._rpc()
+        if self.is_dead or random.random() < self.dead_rate:
+            if not self.is_dead:
+                self.is_dead = True
+                self.stats.dead += 1
+            raise UserDeactivated()
+        if random.random() < self.flood_rate:
+            self.stats.flood_waits += 1
+            raise FloodWait(value=self.flood_wait)
+
+        chat_link = self.stats.peers.get(chat_id, chat_id)
+        due_at = self.stats.due_at.pop(chat_link, None)
+        if due_at is not None:
+            self.stats.lags.append(time.time() - due_at)
+        self.stats.posts += len(message_ids)
+        return [FakeMessage(next(self._msg_ids), forward_from_message_id=msg_id) for msg_id in message_ids]
+
+    async def forward_messages(self, chat_id, from_chat_id, message_ids):
+        return await self._send(chat_id, message_ids)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id):
+        return (await self._send(chat_id, [message_id]))[0]
+
+    async def copy_media_group(self, chat_id, from_chat_id, message_id):
+        return await self._send(chat_id, [message_id])
+
+
+class FakeCursor:
+    def __init__(self, stats, latency):
+        self.stats = stats
+        self.latency = latency
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params=None):
+        self.stats.round_trips += 1
+        await asyncio.sleep(self.latency)
+
+    async def executemany(self, query, rows):
+        # aiomysql сворачивает INSERT ... VALUES в один запрос, UPDATE уходит построчно
+        self.stats.round_trips += 1 if query.lstrip().upper().startswith("INSERT") else len(rows)
+        await asyncio.sleep(self.latency)
+
+    async def fetchall(self):
+        return []
+
+    async def fetchone(self):
+        return None
+
+
+class FakeConnection:
+    def __init__(self, stats, latency):
+        self.stats = stats
+        self.latency = latency
+
+    def cursor(self):
+        return FakeCursor(self.stats, self.latency)
+
+    async def begin(self):
+        self.stats.transactions += 1
+        self.stats.round_trips += 1
+
+    async def commit(self):
+        self.stats.round_trips += 1
+
+    async def rollback(self):
+        self.stats.round_trips += 1
+
+
+def install_fake_db(stats, latency):
+    # Все запросы db.py идут через _with_reconnect: подменяем только его,
+    # так что SQL-пути рассыльщика и WriteBuffer выполняются как есть
+    async def with_fake_connection(operation):
+        return await operation(FakeConnection(stats, latency))
+
+    db._with_reconnect = with_fake_connection
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args):
+    stats = Stats()
+    install_fake_db(stats, args.db_latency / 1000)
+
+    def client_factory(account_id, session_string, phone):
+        app = FakeClient(stats, args.latency / 1000, args.flood_rate, args.flood_wait, args.dead_rate)
+        app.phone_number = phone
+        app.account_id = account_id
+        return app
+
+    writes = WriteBuffer()
+    writes.start()
+    bc = Broadcaster(writes, client_factory=client_factory)
+    # Аренды чатов в бенчмарке не нужны: инстанс один
+    bc.leases = None
+
+    for account_id in range(1, args.accounts + 1):
+        bc.add_session(account_id, "", f"+1000000{account_id:04d}")
+
+    now = time.time()
+    interval_minutes = args.interval / 60
+    rows = []
+    for i in range(args.destinations):
+        # Первые дедлайны равномерно размазаны по --spread секундам
+        first_due = now + (args.spread * i / args.destinations if args.destinations else 0)
+        last_sent = datetime.fromtimestamp(first_due - args.interval, timezone.utc).replace(tzinfo=None)
+        rows.append((f"bench_chat_{i}", interval_minutes, last_sent, args.batch, args.mode, None))
+    bc.scheduler.load(rows)
+    bc.content.set_sources([SOURCE])
+
+    wait_due = bc.scheduler.wait_due
+
+    async def recording_wait_due():
+        due = await wait_due()
+        for dest in due:
+            stats.due_at[dest.chat_link] = dest.next_due()
+        return due
+
+    bc.scheduler.wait_due = recording_wait_due
+
+    started = time.time()
+    await bc.start_clients()
+    startup = time.time() - started
+    round_trips_before = stats.round_trips
+
+    loop_task = asyncio.create_task(bc.run())
+    await asyncio.sleep(args.duration)
+    loop_task.cancel()
+    try:
+        await loop_task
+    except asyncio.CancelledError:
+        pass
+    await bc.stop()
+    await writes.stop()
+    elapsed = time.time() - started - startup
+
+    round_trips = stats.round_trips - round_trips_before
+    print(f"Accounts: {args.accounts}, destinations: {args.destinations}, interval: {args.interval}s, "
+          f"batch: {args.batch}, mode: {args.mode}")
+    print(f"RPC latency: {args.latency}ms, DB latency: {args.db_latency}ms, "
+          f"FloodWait rate: {args.flood_rate}, dead rate: {args.dead_rate}")
+    print(f"Client startup: {startup:.2f}s")
+    print(f"Posts sent: {stats.posts} in {elapsed:.1f}s ({stats.posts / elapsed:.1f} posts/sec)")
+    print(f"Lag vs schedule: avg {sum(stats.lags) / len(stats.lags) if stats.lags else 0:.3f}s, "
+          f"p50 {percentile(stats.lags, 0.5):.3f}s, p95 {percentile(stats.lags, 0.95):.3f}s, "
+          f"max {max(stats.lags, default=0):.3f}s")
+    print(f"DB round trips: {round_trips} ({round_trips / stats.posts if stats.posts else 0:.2f} per post), "
+          f"transactions: {stats.transactions}")
+    print(f"FloodWaits: {stats.flood_waits}, dead accounts: {stats.dead}, "
+          f"accounts left in pool: {len(bc.pool)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк рассыльщика: фейковые клиенты Telegram и БД")
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--destinations", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=10, help="интервал чата, сек")
+    parser.add_argument("--spread", type=float, default=0, help="разброс первых дедлайнов, сек")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--mode", type=int, default=0, choices=(0, 1))
+    parser.add_argument("--duration", type=float, default=30, help="длительность прогона, сек")
+    parser.add_argument("--latency", type=float, default=200, help="задержка RPC Telegram, мс")
+    parser.add_argument("--db-latency", type=float, default=1, help="задержка запроса к БД, мс")
+    parser.add_argument("--flood-rate", type=float, default=0, help="вероятность FloodWait на отправку")
+    parser.add_argument("--flood-wait", type=int, default=30, help="длительность FloodWait, сек")
+    parser.add_argument("--dead-rate", type=float, default=0, help="вероятность бана аккаунта на отправку")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if not args.verbose:
+        logging.getLogger("log_config").setLevel(logging.CRITICAL + 1)
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
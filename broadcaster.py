@@ -0,0 +1,334 @@
+import asyncio
+import time
+from datetime import timezone
+
+from pyrogram import Client
+
+from accounts import AccountPool
+from circuit import CircuitBreaker
+from content_pool import ContentPool
+from db import get_active_sessions, get_sources, get_destinations_full
+from dispatcher import Dispatcher
+from env_loader import (API_ID, API_HASH, CONTENT_POOL_SIZE, CONTENT_MAX_AGE, CONTENT_REFRESH_INTERVAL,
+                        CLIENT_START_CONCURRENCY, LAZY_CONNECT, LAZY_IDLE_TIMEOUT, INSTANCE_ID, LEASE_SECONDS,
+                        SHARD_SYNC_INTERVAL, DEDUP_WINDOW, HISTORY_RETENTION_DAYS, PACER_DESTINATION_INTERVAL,
+                        PACER_ACCOUNT_INTERVAL, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_BASE_BACKOFF, CIRCUIT_MAX_BACKOFF)
+from log_config import logger
+from pacer import Pacer
+from peer_cache import PeerCache
+from scheduler import DueScheduler
+from sent_index import SentIndex
+from sharding import LeaseManager
+from write_buffer import utc_now
+
+HISTORY_LIMIT = 20
+CONTENT_RETRY_DELAY = 60
+LEASE_RETRY_DELAY = 30  # чат в работе у другого инстанса — проверим снова через N секунд
+
+
+def create_client(account_id, session_string, phone):
+    app = Client(f"client_{phone}", api_id=API_ID, api_hash=API_HASH, session_string=session_string, in_memory=True)
+    app.phone_number = phone
+    app.account_id = account_id
+    return app
+
+
+class Broadcaster:
+    # Живое состояние рассыльщика: пул аккаунтов, расписание чатов и кэш контента.
+    # Изменения аккаунтов, источников и получателей применяются без перезапуска процесса.
+
+    def __init__(self, writes, client_factory=create_client):
+        self.writes = writes
+        self.pool = AccountPool()
+        self.peers = PeerCache()
+        self.sent = SentIndex(DEDUP_WINDOW, HISTORY_RETENTION_DAYS)
+        self.pacer = Pacer(PACER_DESTINATION_INTERVAL, PACER_ACCOUNT_INTERVAL)
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_BASE_BACKOFF, CIRCUIT_MAX_BACKOFF)
+        self.dispatcher = Dispatcher(self.pool, writes, self.peers, connect=self.ensure_connected, sent=self.sent,
+                                     pacer=self.pacer, breaker=self.breaker)
+        self.scheduler = DueScheduler()
+        self.content = ContentPool(HISTORY_LIMIT, CONTENT_POOL_SIZE, CONTENT_MAX_AGE, CONTENT_REFRESH_INTERVAL)
+        self.admin_client = None
+        self._client_factory = client_factory
+        self._accounts = {}     # {account_id: Client}
+        self._flood_until = {}  # {Client: unix time} — применяется при входе в пул
+        self._locks = {}        # {account_id: Lock} — запуск/остановка клиента
+        self._startup = None
+        self._reaper = None
+        # Шардинг: чат рассылается только под арендой этого инстанса
+        self.leases = LeaseManager(INSTANCE_ID, LEASE_SECONDS) if INSTANCE_ID else None
+        self._sync_task = None
+        self._lease_tasks = set()
+
+    @property
+    def clients(self):
+        return self.pool.clients
+
+    async def load(self):
+        await self.peers.load()
+        await self.sent.load()
+        self.scheduler.load(await get_destinations_full())
+        self.content.set_sources(await get_sources())
+
+    def add_session(self, account_id, session_string, phone, flood_until=None):
+        app = self._client_factory(account_id, session_string, phone)
+        app.last_used = 0
+        self._accounts[account_id] = app
+        if flood_until:
+            self._flood_until[app] = flood_until.replace(tzinfo=timezone.utc).timestamp()
+        # В ленивом режиме аккаунт попадает в пул сразу и подключается при первой отправке
+        if LAZY_CONNECT:
+            self._join_pool(app)
+        return app
+
+    def _join_pool(self, app):
+        if app in self.pool or self._accounts.get(app.account_id) is not app:
+            return
+        self.pool.add(app)
+        ready_at = self._flood_until.pop(app, None)
+        if ready_at and ready_at > time.time():
+            self.pool.cool_down(app, ready_at - time.time(), persist=False)
+
+    def _lock_for(self, app):
+        return self._locks.setdefault(app.account_id, asyncio.Lock())
+
+    async def _connect(self, app):
+        if not app.is_connected:
+            await app.start()
+            await self.peers.prime(app)
+        app.last_used = time.time()
+
+    async def start_client(self, app):
+        async with self._lock_for(app):
+            await self._connect(app)
+        self._join_pool(app)
+
+    async def ensure_connected(self, app):
+        async with self._lock_for(app):
+            await self._connect(app)
+
+    async def _try_start(self, app):
+        try:
+            await self.start_client(app)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to start {app.phone_number}: {e}")
+            return False
+
+    async def start_clients(self):
+        # Админом становится первый успешно запущенный клиент
+        apps = list(self._accounts.values())
+
+        if LAZY_CONNECT:
+            for app in apps:
+                if await self._try_start(app):
+                    self.admin_client = app
+                    return app
+            return None
+
+        slots = asyncio.Semaphore(CLIENT_START_CONCURRENCY)
+        first_ready = asyncio.get_running_loop().create_future()
+
+        async def start(app):
+            async with slots:
+                if await self._try_start(app) and not first_ready.done():
+                    first_ready.set_result(app)
+
+        self._startup = asyncio.gather(*[start(app) for app in apps])
+        self._startup.add_done_callback(
+            lambda _: logger.info(f"Clients started: {len(self.pool)}/{len(apps)}"))
+        await asyncio.wait([first_ready, self._startup], return_when=asyncio.FIRST_COMPLETED)
+
+        if first_ready.done():
+            self.admin_client = first_ready.result()
+        return self.admin_client
+
+    async def start_account(self, account_id, session_string, phone, flood_until=None):
+        app = self.add_session(account_id, session_string, phone, flood_until)
+        if LAZY_CONNECT:
+            logger.info(f"Account {phone} joined the pool (lazy).")
+            return app
+        if not await self._try_start(app):
+            self.pool.remove(app)
+            self._accounts.pop(account_id, None)
+            return None
+        logger.info(f"Account {phone} joined the pool.")
+        return app
+
+    async def stop_account(self, app):
+        # Новые отправки аккаунт не получит; текущую даем завершить
+        self.pool.remove(app)
+        self._accounts.pop(app.account_id, None)
+        await self.pool.wait_released(app)
+        await self._disconnect(app)
+        logger.info(f"Account {app.phone_number} left the pool.")
+
+    async def reload_accounts(self):
+        sessions = {row[0]: row for row in await get_active_sessions() or []}
+
+        added = [row for account_id, row in sessions.items() if account_id not in self._accounts]
+        removed = [app for account_id, app in self._accounts.items()
+                   if account_id not in sessions and app is not self.admin_client]
+
+        started = await asyncio.gather(*[self.start_account(*row) for row in added])
+        await asyncio.gather(*[self.stop_account(app) for app in removed])
+        return len([app for app in started if app]), len(removed)
+
+    async def reload_config(self):
+        self.content.set_sources(await get_sources())
+        self.scheduler.sync(await get_destinations_full(), refresh_times=self.leases is not None)
+
+    async def _disconnect(self, app):
+        async with self._lock_for(app):
+            try:
+                if app.is_connected:
+                    await app.stop()
+            except Exception as e:
+                logger.error(f"Failed to stop {app.phone_number}: {e}")
+
+    async def _reap_idle(self):
+        # Ленивый режим: отключаем аккаунты, простаивающие дольше LAZY_IDLE_TIMEOUT
+        while True:
+            await asyncio.sleep(max(1, LAZY_IDLE_TIMEOUT // 2))
+            border = time.time() - LAZY_IDLE_TIMEOUT
+            for app in self.pool.clients:
+                if app is self.admin_client or not app.is_connected:
+                    continue
+                async with self._lock_for(app):
+                    # Проверка под блокировкой: занятый аккаунт ждет ее в ensure_connected
+                    if self.pool.is_busy(app) or app.last_used > border:
+                        continue
+                    try:
+                        await app.stop()
+                        logger.info(f"Account {app.phone_number} disconnected after {LAZY_IDLE_TIMEOUT}s idle.")
+                    except Exception as e:
+                        logger.error(f"Failed to stop {app.phone_number}: {e}")
+
+    async def _sync_loop(self):
+        # Получателей могли добавить или разослать другие инстансы
+        while True:
+            await asyncio.sleep(SHARD_SYNC_INTERVAL)
+            try:
+                await self.reload_config()
+            except Exception as e:
+                logger.error(f"Failed to sync destinations: {e}")
+
+    async def _claim(self, due, pending):
+        claimed = await self.leases.claim(dest.chat_link for dest in due)
+        others = [dest.chat_link for dest in due if dest.chat_link not in claimed]
+        pending.difference_update(others)
+        if not others:
+            return due
+
+        times = {}
+        try:
+            times = await self.leases.last_sent_times(others)
+        except Exception as e:
+            logger.error(f"Failed to read send times: {e}")
+        now = time.time()
+        for chat_link in others:
+            dest = self.scheduler.destinations.get(chat_link)
+            sent_at = times.get(chat_link)
+            # Уже разослан другим инстансом — ждем следующего интервала, иначе он сейчас в работе
+            if dest is not None and sent_at and sent_at + dest.interval_seconds > now:
+                self.scheduler.mark_sent(chat_link, sent_at)
+            else:
+                self.scheduler.retry([chat_link], LEASE_RETRY_DELAY)
+        return [dest for dest in due if dest.chat_link in claimed]
+
+    def _release(self, chat_links, sent_at=None):
+        task = asyncio.create_task(self._safe_release(chat_links, sent_at))
+        self._lease_tasks.add(task)
+        task.add_done_callback(self._lease_tasks.discard)
+
+    async def _safe_release(self, chat_links, sent_at):
+        try:
+            await self.leases.release(chat_links, sent_at)
+        except Exception as e:
+            logger.error(f"Failed to release leases for {', '.join(chat_links)}: {e}")
+
+    def _on_sent(self, chat_link, task):
+        if task.cancelled():
+            # Рассылку прервали (остановка бота) — чат не отправлен, время отправки не пишем
+            if self.leases is not None:
+                self._release([chat_link])
+            return
+        self.scheduler.mark_sent(chat_link)
+        if self.leases is not None:
+            self._release([chat_link], utc_now())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+        self.sent.stop()
+        await self.dispatcher.stop()
+        if self.leases is not None:
+            if self._lease_tasks:
+                await asyncio.gather(*self._lease_tasks, return_exceptions=True)
+            await self.leases.stop()
+
+    async def run(self):
+        if LAZY_CONNECT and self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_idle())
+        self.sent.start()
+
+        if self.leases is not None and self._sync_task is None:
+            # Аренды, оставшиеся от прошлого запуска этого же инстанса
+            await self.leases.release_all()
+            self.leases.start(self.dispatcher.active_links)
+            self._sync_task = asyncio.create_task(self._sync_loop())
+            logger.info(f"Sharding enabled: instance {INSTANCE_ID}, lease {LEASE_SECONDS}s")
+
+        while True:
+            due = await self.scheduler.wait_due()
+            pending = {dest.chat_link for dest in due}
+            claimed = set()
+            try:
+                if self.leases is not None:
+                    due = await self._claim(due, pending)
+                    claimed = {dest.chat_link for dest in due}
+                    if not due:
+                        continue
+
+                await self.content.refresh(self.admin_client)
+                content_pool = self.content.posts()
+
+                if not content_pool:
+                    logger.warning(f"No valid content found. Retrying in {CONTENT_RETRY_DELAY} seconds...")
+                    continue
+
+                for dest in due:
+                    if not self.breaker.allow(dest.chat_link):
+                        # Чат на паузе после сбоев — вернемся к нему, когда она закончится
+                        self.scheduler.retry([dest.chat_link], self.breaker.retry_in(dest.chat_link))
+                        pending.discard(dest.chat_link)
+                        continue
+                    logger.info(f"Time to post in {dest.chat_link}!")
+
+                    # if dest.last_msg_id:
+                    #     for deleter in self.clients:
+                    #         try:
+                    #             await deleter.delete_messages(dest.chat_link, dest.last_msg_id)
+                    #             logger.info(f"🗑 Deleted old msg {dest.last_msg_id} in {dest.chat_link}")
+                    #             break
+                    #         except Exception:
+                    #             pass
+
+                    posts_to_send = self.sent.choose(dest.chat_link, content_pool, dest.batch_size)
+                    task = self.dispatcher.submit(dest.chat_link, dest.send_mode, posts_to_send)
+                    if task is None:
+                        continue
+                    task.add_done_callback(lambda done, link=dest.chat_link: self._on_sent(link, done))
+                    pending.discard(dest.chat_link)
+
+            except Exception as e:
+                logger.error(f"FATAL ERROR in main loop: {e}")
+
+            finally:
+                self.scheduler.retry(pending, CONTENT_RETRY_DELAY)
+                # Чат не ушел в рассылку — аренду отдаем, пусть его попробует другой инстанс
+                idle = [link for link in claimed & pending if not self.dispatcher.is_active(link)]
+                if idle:
+                    self._release(idle)
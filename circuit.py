@@ -0,0 +1,117 @@
+import time
+
+from pyrogram.errors import (ChannelPrivate, ChannelInvalid, ChatWriteForbidden, ChatAdminRequired, ChatIdInvalid,
+                             ChatRestricted, UserBannedInChannel, PeerIdInvalid, UsernameNotOccupied, UsernameInvalid,
+                             InviteHashExpired, InviteHashInvalid, UserNotParticipant)
+
+from log_config import logger
+
+# Ошибки, которые говорят о самом чате (удален, закрыт, битая ссылка), а не об аккаунте или сети.
+# Повтор с другого аккаунта почти никогда не помогает.
+PERMANENT_ERRORS = (ChatAdminRequired, ChatIdInvalid, ChatRestricted, UsernameNotOccupied, UsernameInvalid,
+                    InviteHashExpired, InviteHashInvalid)
+
+# У этого аккаунта нет доступа к чату (не состоит, забанен в нем, не знает peer) — другой аккаунт может отправить.
+# Против чата считаются, только если не смог ни один аккаунт
+ACCESS_ERRORS = (ChannelPrivate, ChannelInvalid, ChatWriteForbidden, PeerIdInvalid, UserNotParticipant)
+
+# Аккаунт в спам-блоке (@SpamBot): писать не может ни в один чат
+ACCOUNT_ERRORS = (UserBannedInChannel,)
+
+# Исход одной попытки отправки
+SENT = "sent"
+PERMANENT = "permanent"  # проблема чата
+ACCESS = "access"        # у аккаунта нет доступа к чату
+TRANSIENT = "transient"  # сеть, неизвестная ошибка
+ACCOUNT = "account"      # проблема аккаунта (FloodWait, slow mode, бан) — здоровье чата не затрагивает
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def classify(error):
+    if isinstance(error, PERMANENT_ERRORS):
+        return PERMANENT
+    if isinstance(error, ACCESS_ERRORS):
+        return ACCESS
+    if isinstance(error, ACCOUNT_ERRORS):
+        return ACCOUNT
+    return TRANSIENT
+
+
+class CircuitState:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0       # подряд неудачных пачек
+        self.opens = 0          # сколько раз подряд размыкался — для экспоненциальной паузы
+        self.open_until = 0
+        self.reason = None
+
+
+class CircuitBreaker:
+    # Здоровье чатов-получателей. Чат, в который подряд не смог отправить ни один аккаунт, размыкается:
+    # сразу, если все ошибки постоянные, или после failure_threshold временных сбоев.
+    # Пауза растет вдвое с каждым размыканием; по ее окончании идет одна пробная отправка (half-open).
+
+    def __init__(self, failure_threshold, base_backoff, max_backoff, probe_attempts=2):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.probe_attempts = probe_attempts
+        self._states = {}  # {chat_link: CircuitState}
+
+    def allow(self, chat_link):
+        # Можно ли сейчас отправлять в чат; истекшая пауза переводит его в half-open
+        state = self._states.get(chat_link)
+        if state is None or state.state == CLOSED:
+            return True
+        if state.state == OPEN and time.time() >= state.open_until:
+            state.state = HALF_OPEN
+            logger.info(f"Circuit for {chat_link} is half-open: probing")
+        return state.state == HALF_OPEN
+
+    def retry_in(self, chat_link):
+        state = self._states.get(chat_link)
+        if state is None or state.state != OPEN:
+            return 0
+        return max(0, state.open_until - time.time())
+
+    def max_attempts(self, chat_link):
+        # В half-open пробуем отправить только с нескольких аккаунтов, а не со всего пула
+        state = self._states.get(chat_link)
+        return self.probe_attempts if state is not None and state.state == HALF_OPEN else None
+
+    def record_success(self, chat_link):
+        state = self._states.pop(chat_link, None)
+        if state is not None and state.state != CLOSED:
+            logger.info(f"Circuit for {chat_link} closed: delivery restored")
+
+    def record_failure(self, chat_link, kind, reason=None):
+        state = self._states.setdefault(chat_link, CircuitState())
+        state.failures += 1
+        state.reason = reason or state.reason
+        if state.state == HALF_OPEN or kind == PERMANENT or state.failures >= self.failure_threshold:
+            self._open(chat_link, state)
+
+    def reset(self, chat_link):
+        self._states.pop(chat_link, None)
+
+    def _open(self, chat_link, state):
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** state.opens)
+        state.opens += 1
+        state.state = OPEN
+        state.open_until = time.time() + backoff
+        logger.warning(f"Circuit for {chat_link} opened for {backoff:.0f}s after {state.failures} failed "
+                       f"attempt(s): {state.reason}")
+
+    def describe(self, chat_link):
+        state = self._states.get(chat_link)
+        if state is None or state.state == CLOSED and not state.failures:
+            return "🟢"
+        if state.state == CLOSED:
+            return f"🟡 сбоев подряд: {state.failures}"
+        if state.state == HALF_OPEN:
+            return "🟡 проверка"
+        until = time.strftime("%H:%M", time.localtime(state.open_until))
+        return f"🔴 пауза до {until} ({state.reason})"
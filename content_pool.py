@@ -0,0 +1,219 @@
+import time
+from collections import OrderedDict
+
+from log_config import logger
+from metrics import metrics
+
+
+def is_eligible(post):
+    # В ротацию попадают только посты с inline-кнопками
+    return bool(post.reply_markup)
+
+
+class Post:
+    # Единица рассылки: одиночное сообщение или целый альбом (media group)
+
+    def __init__(self, messages, source=None):
+        self.messages = sorted(messages, key=lambda m: m.id)
+        self._source = source  # явная ссылка на источник, например username из ссылки на пост
+
+    @property
+    def id(self):
+        return self.messages[0].id
+
+    @property
+    def chat(self):
+        return self.messages[0].chat
+
+    @property
+    def date(self):
+        return self.messages[0].date
+
+    @property
+    def source(self):
+        # Как отправитель находит канал-источник. access_hash у каждого аккаунта свой, поэтому
+        # публичный канал резолвится по username; id подойдет только тем, кто уже видел канал
+        return self._source or self.chat.username or self.chat.id
+
+    @property
+    def message_ids(self):
+        return [m.id for m in self.messages]
+
+    @property
+    def is_album(self):
+        return self.messages[0].media_group_id is not None
+
+
+class SourceCache:
+    def __init__(self, source):
+        self.source = source
+        self.chat_id = None
+        self.last_seen_id = 0
+        self.backfilled = False  # первая загрузка истории прошла; до нее live-апдейты не сдвигают курсор
+        self.refreshed_at = 0
+        self.posts = OrderedDict()   # {key: Post}, только подходящие посты; key — id сообщения или "g<media_group_id>"
+        self.albums = OrderedDict()  # {media_group_id: {message_id: Message}} — все части альбомов
+        self.index = {}              # {message_id: key}
+
+
+class ContentPool:
+    def __init__(self, history_limit, max_size, max_age=0, refresh_interval=0):
+        self.history_limit = history_limit
+        self.max_size = max_size
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self._caches = {}     # {source: SourceCache}
+        self._by_chat = {}    # {chat_id: SourceCache}
+        self._by_username = {}
+        self._snapshot = None
+
+    @property
+    def sources(self):
+        return list(self._caches)
+
+    def add_source(self, source):
+        if source not in self._caches:
+            self._caches[source] = self._by_username[source.lower()] = SourceCache(source)
+
+    def set_sources(self, sources):
+        for source in sources:
+            self.add_source(source)
+        for source in list(self._caches):
+            if source not in sources:
+                self.remove_source(source)
+
+    def remove_source(self, source):
+        cache = self._caches.pop(source, None)
+        if cache is not None:
+            self._by_chat.pop(cache.chat_id, None)
+            self._by_username.pop(source.lower(), None)
+            self._snapshot = None
+
+    def _cache_for(self, chat):
+        if chat is None:
+            return None
+        cache = self._by_chat.get(chat.id)
+        if cache is None and chat.username:
+            cache = self._by_username.get(chat.username.lower())
+            if cache is not None:
+                cache.chat_id = chat.id
+                self._by_chat[chat.id] = cache
+        return cache
+
+    def accepts(self, message):
+        return self._cache_for(message.chat) is not None
+
+    async def refresh(self, client, force=False):
+        now = time.time()
+        for cache in list(self._caches.values()):
+            if not force and cache.refreshed_at and now - cache.refreshed_at < self.refresh_interval:
+                continue
+            try:
+                with metrics.timer("broadcaster_history_fetch_seconds", source=cache.source):
+                    await self._fetch_new(client, cache)
+                cache.refreshed_at = now
+            except Exception as e:
+                logger.error(f"Error fetching history of {cache.source}: {e}")
+
+    async def _fetch_new(self, client, cache):
+        # История идет от новых к старым: читаем до последнего уже известного id.
+        # Первый раз читаем всю глубину: last_seen_id мог поднять live-апдейт, пришедший раньше.
+        # Уже пришедшие сообщения просто перезапишутся — ключи в кэше по id
+        new_posts = []
+        async for post in client.get_chat_history(cache.source, limit=self.history_limit):
+            if cache.backfilled and post.id <= cache.last_seen_id:
+                break
+            new_posts.append(post)
+
+        for post in reversed(new_posts):
+            self._store(cache, post)
+        cache.backfilled = True
+
+    def feed(self, message):
+        cache = self._cache_for(message.chat)
+        if cache is not None:
+            self._store(cache, message)
+
+    def discard(self, messages):
+        for message in messages:
+            cache = self._cache_for(message.chat)
+            if cache is None:
+                continue
+            key = cache.index.pop(message.id, None)
+            if key is None:
+                continue
+            if isinstance(key, str):
+                group_id = int(key[1:])
+                parts = cache.albums.get(group_id, {})
+                parts.pop(message.id, None)
+                if not parts:
+                    cache.albums.pop(group_id, None)
+                self._update_album(cache, group_id)
+            else:
+                self._drop(cache, key)
+
+    def _store(self, cache, message):
+        if cache.chat_id is None and message.chat:
+            cache.chat_id = message.chat.id
+            self._by_chat[message.chat.id] = cache
+        cache.last_seen_id = max(cache.last_seen_id, message.id)
+
+        group_id = message.media_group_id
+        if group_id:
+            cache.albums.setdefault(group_id, {})[message.id] = message
+            cache.albums.move_to_end(group_id)
+            cache.index[message.id] = f"g{group_id}"
+            self._update_album(cache, group_id)
+            while len(cache.albums) > self.max_size:
+                old_group, _ = cache.albums.popitem(last=False)
+                self._drop(cache, f"g{old_group}")
+        # Отредактированный пост мог потерять кнопки — тогда убираем его из ротации
+        elif is_eligible(message):
+            self._put(cache, message.id, Post([message]))
+        else:
+            self._drop(cache, message.id)
+
+    def _update_album(self, cache, group_id):
+        parts = cache.albums.get(group_id)
+        key = f"g{group_id}"
+        if parts and any(is_eligible(m) for m in parts.values()):
+            self._put(cache, key, Post(parts.values()))
+        elif key in cache.posts:
+            del cache.posts[key]
+            self._snapshot = None
+
+    def _put(self, cache, key, post):
+        cache.posts[key] = post
+        cache.posts.move_to_end(key)
+        for msg_id in post.message_ids:
+            cache.index[msg_id] = key
+        while len(cache.posts) > self.max_size:
+            old_key = next(iter(cache.posts))
+            self._drop(cache, old_key)
+        self._snapshot = None
+
+    def _drop(self, cache, key):
+        post = cache.posts.pop(key, None)
+        if isinstance(key, str):
+            for msg_id in cache.albums.pop(int(key[1:]), {}):
+                cache.index.pop(msg_id, None)
+        elif post is not None:
+            for msg_id in post.message_ids:
+                cache.index.pop(msg_id, None)
+        if post is not None:
+            self._snapshot = None
+
+    def _evict_expired(self):
+        if not self.max_age:
+            return
+        border = time.time() - self.max_age
+        for cache in self._caches.values():
+            expired = [key for key, post in cache.posts.items() if post.date and post.date.timestamp() < border]
+            for key in expired:
+                self._drop(cache, key)
+
+    def posts(self):
+        self._evict_expired()
+        if self._snapshot is None:
+            self._snapshot = [post for cache in self._caches.values() for post in cache.posts.values()]
+        return self._snapshot
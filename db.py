@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timezone
+
+from env_loader import DB_BACKEND, DB_HEALTHCHECK_INTERVAL, INSTANCE_ID
+from log_config import logger
+from metrics import metrics
+
+# Хранилище выбирается через DB_BACKEND: mysql (по умолчанию) или sqlite — встроенная БД для одной ноды.
+# Модули бэкендов отдают одинаковый интерфейс: init_pool/close_pool/reset_pool, run(operation) и dialect.
+if DB_BACKEND == "sqlite":
+    import db_sqlite as backend
+elif DB_BACKEND == "mysql":
+    import db_mysql as backend
+else:
+    raise ValueError(f"Unknown DB_BACKEND: {DB_BACKEND} (expected mysql or sqlite)")
+
+# Отличающиеся между бэкендами куски SQL: время, upsert, блокировки строк
+dialect = backend.dialect
+
+
+async def init_pool():
+    return await backend.init_pool()
+
+
+async def close_pool():
+    await backend.close_pool()
+
+
+async def reset_pool():
+    return await backend.reset_pool()
+
+
+async def _with_reconnect(operation):
+    return await backend.run(operation)
+
+
+def is_connection_error(e):
+    # Сбой связи с БД (повтор поможет), а не ошибка в данных запроса
+    return backend.is_connection_error(e)
+
+
+async def execute_query(query, params=None, fetch=None):
+    async def operation(conn):
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            if fetch == 'all':
+                return await cur.fetchall()
+            elif fetch == 'one':
+                return await cur.fetchone()
+            return None
+
+    with metrics.timer("broadcaster_db_query_seconds", op=query.split(None, 1)[0].upper()):
+        return await _with_reconnect(operation)
+
+
+async def execute_in_transaction(callback):
+    # callback(cursor) выполняется внутри одной транзакции
+    async def operation(conn):
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                result = await callback(cur)
+            await conn.commit()
+            return result
+        except Exception:
+            await conn.rollback()
+            raise
+
+    with metrics.timer("broadcaster_db_query_seconds", op="TRANSACTION"):
+        return await _with_reconnect(operation)
+
+
+async def execute_transaction(statements):
+    # statements: [(query, [params, ...])] — каждый запрос выполняется через executemany, все в одной транзакции
+    async def callback(cur):
+        for query, rows in statements:
+            if rows:
+                await cur.executemany(query, rows)
+
+    return await execute_in_transaction(callback)
+
+
+async def check_pool():
+    try:
+        await execute_query("SELECT 1", fetch='one')
+        return True
+    except Exception as e:
+        logger.error(f"DB health check failed: {e}. Recreating pool...")
+        try:
+            await reset_pool()
+        except Exception as reset_error:
+            logger.error(f"DB pool recreation failed: {reset_error}")
+        return False
+
+
+async def health_check_loop():
+    while True:
+        await asyncio.sleep(DB_HEALTHCHECK_INTERVAL)
+        await check_pool()
+
+
+async def save_new_account(phone, session_string):
+    await execute_query(
+        "INSERT INTO accounts (phone, session_string, status, instance_id) VALUES (%s, %s, 'active', %s)",
+        (phone, session_string, INSTANCE_ID or None)
+    )
+
+async def get_existing_phones(phones):
+    phones = list(phones)
+    if not phones:
+        return set()
+    rows = await execute_query(
+        f"SELECT phone FROM accounts WHERE phone IN ({', '.join(['%s'] * len(phones))})", phones, fetch='all')
+    return {row[0] for row in rows or []}
+
+
+async def save_new_accounts(accounts):
+    # accounts: [(phone, session_string)] — одна транзакция, один executemany
+    await execute_transaction([(
+        "INSERT INTO accounts (phone, session_string, status, instance_id) VALUES (%s, %s, 'active', %s)",
+        [(phone, session_string, INSTANCE_ID or None) for phone, session_string in accounts]
+    )])
+
+
+async def get_active_sessions():
+    # flood_wait-аккаунты тоже попадают в пул: они остынут в памяти до flood_until
+    query = "SELECT id, session_string, phone, flood_until FROM accounts WHERE status IN ('active', 'flood_wait')"
+    if INSTANCE_ID:
+        # Шардинг: инстанс работает только со своими аккаунтами
+        return await execute_query(query + " AND instance_id = %s", (INSTANCE_ID,), fetch='all')
+    return await execute_query(query, fetch='all')
+
+
+async def get_sources():
+    rows = await execute_query("SELECT channel_link FROM sources", fetch='all')
+    return [row[0] for row in rows] if rows else []
+
+
+async def add_source(channel_link):
+    await execute_query(f"{dialect.INSERT_IGNORE} INTO sources (channel_link) VALUES (%s)", (channel_link,))
+
+
+async def delete_source(channel_link):
+    await execute_query("DELETE FROM sources WHERE channel_link = %s", (channel_link,))
+
+
+async def save_destination(chat_link, interval_minutes, batch_size):
+    await execute_query(
+        dialect.upsert("destinations", ("chat_link", "interval_minutes", "batch_size"), ("chat_link",),
+                       ("interval_minutes", "batch_size")),
+        (chat_link, interval_minutes, batch_size))
+
+
+async def delete_destination(chat_link):
+    await execute_query("DELETE FROM destinations WHERE chat_link = %s", (chat_link,))
+
+
+async def set_send_mode(chat_link, send_mode):
+    await execute_query("UPDATE destinations SET send_mode = %s WHERE chat_link = %s", (send_mode, chat_link))
+
+
+async def get_destinations_full():
+    return await execute_query("SELECT chat_link, interval_minutes, last_sent_at, batch_size, send_mode, last_msg_id FROM destinations", fetch='all')
+
+async def update_account_status(phone, status, flood_until=None):
+    if flood_until is not None:
+        flood_until = datetime.fromtimestamp(flood_until, timezone.utc).replace(tzinfo=None)
+    await execute_query("UPDATE accounts SET status = %s, flood_until = %s WHERE phone = %s", (status, flood_until, phone))
+
+
+async def revive_accounts():
+    await execute_query(
+        "UPDATE accounts SET status = 'active', flood_until = NULL WHERE status = 'flood_wait' AND "
+        f"(flood_until <= {dialect.UTC_NOW} OR (flood_until IS NULL AND last_used < {dialect.shift(dialect.CURRENT, -1800)}))")
@@ -0,0 +1,121 @@
+import asyncio
+
+import aiomysql
+from aiomysql import OperationalError, InterfaceError
+
+from env_loader import (DB_HOST, DB_PORT, DB_USER, DB_PASS, DB_NAME, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+                        DB_POOL_RECYCLE, DB_RECONNECT_ATTEMPTS)
+from log_config import logger
+
+DB_CONFIG = {
+    'host': DB_HOST,
+    'port': DB_PORT,
+    'user': DB_USER,
+    'password': DB_PASS,
+    'db': DB_NAME
+}
+
+# Коды MySQL-клиента, при которых соединение потеряно и запрос можно повторить
+CONNECTION_LOST_CODES = (2003, 2006, 2013, 2055)
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+class MySQLDialect:
+    # Куски SQL, которые отличаются между бэкендами (см. SQLiteDialect в db_sqlite.py)
+    CURRENT = "NOW()"              # время в том же поясе, что и DEFAULT CURRENT_TIMESTAMP
+    UTC_NOW = "UTC_TIMESTAMP()"    # время в UTC — для колонок, которые пишет само приложение
+    INSERT_IGNORE = "INSERT IGNORE"
+    LOCK_ROWS = " FOR UPDATE SKIP LOCKED"
+
+    @staticmethod
+    def shift(expr, seconds):
+        return f"{expr} + INTERVAL ({seconds}) SECOND"
+
+    @staticmethod
+    def greatest(*exprs):
+        return f"GREATEST({', '.join(exprs)})"
+
+    @staticmethod
+    def unix_time(expr):
+        return f"UNIX_TIMESTAMP({expr})"
+
+    @staticmethod
+    def upsert(table, columns, keys, updates):
+        # keys нужны только SQLite: MySQL сам находит конфликтующий уникальный ключ
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {', '.join(f'{column} = VALUES({column})' for column in updates)}")
+
+    @staticmethod
+    def delete_limited(table, where):
+        # Последний параметр запроса — LIMIT
+        return f"DELETE FROM {table} WHERE {where} LIMIT %s"
+
+
+dialect = MySQLDialect()
+
+
+def is_connection_error(e):
+    if isinstance(e, InterfaceError):
+        return True
+    if isinstance(e, OperationalError):
+        return bool(e.args) and e.args[0] in CONNECTION_LOST_CODES
+    return isinstance(e, (ConnectionError, asyncio.TimeoutError))
+
+
+async def init_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is None or _pool.closed:
+            # autocommit: соединения переиспользуются, SELECT не должен держать открытую транзакцию
+            _pool = await aiomysql.create_pool(
+                minsize=DB_POOL_MIN_SIZE,
+                maxsize=DB_POOL_MAX_SIZE,
+                pool_recycle=DB_POOL_RECYCLE,
+                autocommit=True,
+                **DB_CONFIG
+            )
+            logger.info(f"DB pool created (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.close()
+            await _pool.wait_closed()
+            logger.info("DB pool closed")
+        _pool = None
+
+
+async def reset_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            try:
+                await _pool.wait_closed()
+            except Exception:
+                pass
+        _pool = None
+    return await init_pool()
+
+
+async def run(operation):
+    # operation(conn) с повтором при потере соединения
+    for attempt in range(1, DB_RECONNECT_ATTEMPTS + 1):
+        pool = await init_pool()
+        try:
+            async with pool.acquire() as conn:
+                return await operation(conn)
+        except Exception as e:
+            if not is_connection_error(e) or attempt == DB_RECONNECT_ATTEMPTS:
+                raise
+            logger.warning(f"DB connection lost: {e}. Reconnecting ({attempt}/{DB_RECONNECT_ATTEMPTS})...")
+            await asyncio.sleep(attempt)
+            try:
+                await reset_pool()
+            except Exception as reset_error:
+                logger.error(f"DB reconnect failed: {reset_error}")
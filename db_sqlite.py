@@ -0,0 +1,185 @@
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+import aiosqlite
+
+from env_loader import SQLITE_PATH
+from log_config import logger
+
+SCHEMA_FILE = Path(__file__).with_name("setup_database_sqlite.sql")
+STATEMENT_CACHE_SIZE = 512  # подготовленных запросов на соединение (кэш sqlite3 по тексту SQL)
+BUSY_TIMEOUT_MS = 5000      # сколько ждать, если файл БД занят другим процессом (например, миграцией)
+
+# Основные коды SQLite, после которых запрос можно повторить: SQLITE_BUSY, SQLITE_LOCKED, SQLITE_IOERR, SQLITE_FULL
+RETRYABLE_CODES = (5, 6, 10, 13)
+
+# Время хранится так же, как его отдает datetime('now') / CURRENT_TIMESTAMP: строки сравниваются как даты
+sqlite3.register_adapter(datetime, lambda value: value.strftime("%Y-%m-%d %H:%M:%S"))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+_conn = None
+_conn_lock = asyncio.Lock()
+_query_lock = asyncio.Lock()
+
+
+class SQLiteDialect:
+    # Куски SQL, которые отличаются между бэкендами (см. MySQLDialect в db_mysql.py). Все время — UTC
+    CURRENT = "datetime('now')"
+    UTC_NOW = "datetime('now')"
+    INSERT_IGNORE = "INSERT OR IGNORE"
+    LOCK_ROWS = ""  # транзакции и так идут через BEGIN IMMEDIATE — пишущий всегда один
+
+    @staticmethod
+    def shift(expr, seconds):
+        return f"datetime({expr}, ({seconds}) || ' seconds')"
+
+    @staticmethod
+    def greatest(*exprs):
+        return f"MAX({', '.join(exprs)})"
+
+    @staticmethod
+    def unix_time(expr):
+        return f"CAST((julianday({expr}) - 2440587.5) * 86400 AS INTEGER)"
+
+    @staticmethod
+    def upsert(table, columns, keys, updates):
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in updates)}")
+
+    @staticmethod
+    def delete_limited(table, where):
+        # Последний параметр запроса — LIMIT
+        return f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT %s)"
+
+
+dialect = SQLiteDialect()
+
+
+def is_connection_error(e):
+    # БД занята другим процессом, ошибка ввода-вывода, кончилось место — запрос можно повторить.
+    # Ошибки в самом SQL (нет такой колонки/таблицы) и ошибки данных повтором не исправить
+    if not isinstance(e, sqlite3.OperationalError):
+        return False
+    code = getattr(e, "sqlite_errorcode", None)  # Python 3.11+
+    if code is None:
+        return "locked" in str(e) or "I/O error" in str(e) or "full" in str(e)
+    # Расширенные коды (SQLITE_IOERR_*) несут основной код в младшем байте
+    return code & 0xFF in RETRYABLE_CODES
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _translate(query):
+    # Весь код пишет запросы с плейсхолдерами MySQL (%s); литералов с '%' в SQL нет
+    return query.replace("%s", "?")
+
+
+class Cursor:
+    # Интерфейс курсора aiomysql, которым пользуется db.py
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    async def execute(self, query, params=None):
+        await self._cursor.execute(_translate(query), params or ())
+
+    async def executemany(self, query, rows):
+        await self._cursor.executemany(_translate(query), rows)
+
+    async def fetchone(self):
+        return await self._cursor.fetchone()
+
+    async def fetchall(self):
+        return await self._cursor.fetchall()
+
+
+class Connection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    @asynccontextmanager
+    async def cursor(self):
+        cursor = await self._conn.cursor()
+        try:
+            yield Cursor(cursor)
+        finally:
+            await cursor.close()
+
+    async def begin(self):
+        # Сразу берем блокировку на запись: иначе две транзакции, начавшие с SELECT, упрутся друг в друга
+        await self._conn.execute("BEGIN IMMEDIATE")
+
+    async def commit(self):
+        await self._conn.commit()
+
+    async def rollback(self):
+        await self._conn.rollback()
+
+    async def close(self):
+        await self._conn.close()
+
+
+async def _open():
+    path = Path(SQLITE_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # isolation_level=None: autocommit, транзакции только явные (begin/commit)
+    conn = await aiosqlite.connect(str(path), isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+    try:
+        # WAL: чтение не ждет записи; synchronous=NORMAL — коммит без fsync, данные переживут падение процесса
+        await conn.execute("PRAGMA journal_mode = WAL")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute("PRAGMA foreign_keys = ON")
+        await conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        await conn.executescript(SCHEMA_FILE.read_text(encoding="utf-8"))
+    except Exception:
+        await conn.close()
+        raise
+    logger.info(f"SQLite database opened: {path} (WAL)")
+    return Connection(conn)
+
+
+async def init_pool():
+    global _conn
+    async with _conn_lock:
+        if _conn is None:
+            _conn = await _open()
+    return _conn
+
+
+async def close_pool():
+    global _conn
+    async with _conn_lock:
+        if _conn is not None:
+            await _conn.close()
+            logger.info("SQLite database closed")
+        _conn = None
+
+
+async def reset_pool():
+    await close_pool()
+    return await init_pool()
+
+
+async def run(operation):
+    # Одно соединение на процесс: запросы идут по очереди, так что транзакция одной корутины
+    # не захватит запросы другой. Каждый запрос — доли миллисекунды, сети нет.
+    conn = await init_pool()
+    async with _query_lock:
+        try:
+            return await operation(conn)
+        finally:
+            # Отмененная посреди транзакции корутина не должна оставить ее открытой
+            if conn.in_transaction:
+                await conn.rollback()
@@ -0,0 +1,268 @@
+import asyncio
+import time
+
+from pyrogram.errors import (FloodWait, SlowmodeWait, UserDeactivated, AuthKeyUnregistered, UsernameNotOccupied,
+                             UsernameInvalid, InviteHashExpired)
+
+from circuit import (CircuitBreaker, classify, ACCESS_ERRORS, ACCOUNT_ERRORS, SENT, PERMANENT, ACCESS, TRANSIENT,
+                     ACCOUNT)
+from db import update_account_status
+from env_loader import (DISPATCH_CONCURRENCY, PACER_DESTINATION_INTERVAL, PACER_ACCOUNT_INTERVAL,
+                        CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_BASE_BACKOFF, CIRCUIT_MAX_BACKOFF)
+from log_config import logger
+from metrics import metrics
+from pacer import Pacer, fetch_slowmode
+
+MAX_SLOWMODE_WAIT = 60  # дольше ждать slow mode не будем — пачка считается неотправленной
+PERMANENT_ATTEMPTS = 3  # столько аккаунтов подряд получили постоянную ошибку чата — остальные не пробуем
+SPAM_COOLDOWN = 6 * 3600  # аккаунт в спам-блоке не пишет никуда — убираем его из рассылки на N секунд
+
+# Аккаунт больше не состоит в чате или чат недоступен — кэш членства сбрасывается
+MEMBERSHIP_ERRORS = ACCESS_ERRORS + (UsernameNotOccupied, UsernameInvalid, InviteHashExpired)
+
+
+def split_batches(send_mode, posts):
+    # Forward: один RPC на канал-источник со всеми id пачки.
+    # Copy: отдельный RPC на каждый пост, альбом уходит целиком через copy_media_group.
+    if send_mode == 1:
+        return [[post] for post in posts]
+    by_source = {}
+    for post in posts:
+        by_source.setdefault(post.chat.id, []).append(post)
+    return list(by_source.values())
+
+
+def map_sent_ids(batch, sent_messages):
+    # {id поста в источнике: id отправленного сообщения}
+    source_ids = [msg_id for post in batch for msg_id in post.message_ids]
+    by_source = {m.forward_from_message_id: m.id for m in sent_messages if getattr(m, "forward_from_message_id", None)}
+    if len(by_source) < len(sent_messages) and len(sent_messages) == len(source_ids):
+        by_source = {source_id: m.id for source_id, m in zip(source_ids, sent_messages)}
+    return {post.id: by_source[post.id] for post in batch if post.id in by_source}
+
+
+class Dispatcher:
+    # Рассылка по чатам идет параллельно: не больше DISPATCH_CONCURRENCY чатов одновременно,
+    # каждый аккаунт из пула занят не больше чем одной отправкой.
+
+    def __init__(self, pool, writes, peers, concurrency=DISPATCH_CONCURRENCY, connect=None, sent=None, pacer=None,
+                 breaker=None):
+        self.pool = pool
+        self.writes = writes
+        self.peers = peers
+        self.sent = sent  # SentIndex: что уже отправлено в каждый чат
+        self.pacer = pacer or Pacer(PACER_DESTINATION_INTERVAL, PACER_ACCOUNT_INTERVAL)
+        self.breaker = breaker or CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_BASE_BACKOFF, CIRCUIT_MAX_BACKOFF)
+        self.connect = connect  # подключение аккаунта по требованию (ленивый режим)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._active = {}  # {chat_link: Task}
+
+    def is_active(self, chat_link):
+        return chat_link in self._active
+
+    def active_links(self):
+        return list(self._active)
+
+    def submit(self, chat_link, send_mode, posts):
+        if chat_link in self._active:
+            return None
+        task = asyncio.create_task(self._run_destination(chat_link, send_mode, posts))
+        self._active[chat_link] = task
+        task.add_done_callback(lambda _: self._active.pop(chat_link, None))
+        return task
+
+    async def wait_idle(self):
+        if self._active:
+            await asyncio.gather(*self._active.values(), return_exceptions=True)
+
+    async def stop(self):
+        for task in list(self._active.values()):
+            task.cancel()
+        await self.wait_idle()
+
+    async def _run_destination(self, chat_link, send_mode, posts):
+        async with self._slots:
+            try:
+                for batch in split_batches(send_mode, posts):
+                    if not await self.send_batch(chat_link, send_mode, batch) and not self.breaker.allow(chat_link):
+                        break
+
+                if posts:
+                    self.writes.update_last_sent_time(chat_link)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Dispatch error for {chat_link}: {e}")
+
+    async def send_batch(self, chat_link, send_mode, batch, scheduled=True):
+        # scheduled=False — ручная рассылка (/send_ad): пишется только history, расписание чата не трогаем
+        await self.pacer.wait_destination(chat_link)
+        max_attempts = self.breaker.max_attempts(chat_link)
+        tried = set()
+        failures = []  # [(kind, reason)]
+        while True:
+            permanent_streak = 0
+            for kind, _ in reversed(failures):
+                if kind == ACCOUNT:
+                    continue
+                if kind != PERMANENT:
+                    break
+                permanent_streak += 1
+            if permanent_streak >= PERMANENT_ATTEMPTS or (max_attempts is not None and len(tried) >= max_attempts):
+                sender = None
+            else:
+                blocked = self.pacer.blocked(chat_link, self.pool.clients)
+                sender = await self.pool.acquire(exclude=tried | blocked)
+                if sender is None:
+                    # Остались только аккаунты, ждущие slow mode в этом чате
+                    wait = self.pacer.next_unblock(chat_link, blocked - tried)
+                    if wait is not None and wait <= MAX_SLOWMODE_WAIT:
+                        await asyncio.sleep(wait)
+                        continue
+
+            if sender is None:
+                logger.critical(f"FAILED to send post(s) {[post.id for post in batch]} to {chat_link}")
+                # Испробованы все аккаунты пула (или все пробные в half-open)
+                exhausted = ((max_attempts is not None and len(tried) >= max_attempts)
+                             or all(client in tried for client in self.pool.clients))
+                self._record_failure(chat_link, failures, exhausted)
+                return False
+            tried.add(sender)
+
+            try:
+                await self.pacer.wait_account(sender)
+                kind, reason = await self._send_with(sender, chat_link, send_mode, batch, scheduled)
+                if kind == SENT:
+                    self.breaker.record_success(chat_link)
+                    return True
+                failures.append((kind, reason))
+                # Аккаунт упёрся в slow mode — он сможет отправить, когда ожидание закончится
+                if sender in self.pacer.blocked(chat_link, [sender]):
+                    tried.discard(sender)
+            finally:
+                self.pool.release(sender)
+
+    def _record_failure(self, chat_link, failures, exhausted):
+        # Сбои по вине аккаунтов (FloodWait, спам-блок) на здоровье чата не влияют,
+        # а нет доступа у аккаунта — только если отправить не смог ни один аккаунт
+        chat_failures = [(kind, reason) for kind, reason in failures
+                         if kind != ACCOUNT and (kind != ACCESS or exhausted)]
+        if not chat_failures:
+            return
+        kind = PERMANENT if all(kind in (PERMANENT, ACCESS) for kind, _ in chat_failures) else TRANSIENT
+        self.breaker.record_failure(chat_link, kind, chat_failures[-1][1])
+
+    async def _send_with(self, sender, chat_link, send_mode, batch, scheduled=True):
+        try:
+            if self.connect is not None:
+                await self.connect(sender)
+
+            # Источник резолвим отдельно: его ошибка говорит об аккаунте, а не о чате-получателе
+            first = batch[0]
+            source = first.source
+            try:
+                await sender.resolve_peer(source)
+            except FloodWait:
+                raise
+            except Exception as e:
+                logger.warning(f"Account {sender.phone_number} can't resolve source {source}: {e}. Switching account.")
+                metrics.inc("broadcaster_sends_total", result="source")
+                return ACCOUNT, f"source {source}: {type(e).__name__}"
+            if isinstance(source, str):
+                # Резолв по username переживет рестарт: peer_cache подложит его в хранилище клиента
+                await self.peers.remember(sender, source)
+
+            if not self.peers.is_member(sender.account_id, chat_link):
+                try:
+                    await sender.join_chat(chat_link)
+                except Exception:
+                    pass
+
+            target = self.peers.target(sender.account_id, chat_link)
+            started = time.perf_counter()
+            if send_mode == 1:
+                if first.is_album:
+                    sent_messages = await sender.copy_media_group(
+                        chat_id=target,
+                        from_chat_id=source,
+                        message_id=first.id
+                    )
+                else:
+                    sent_messages = [await sender.copy_message(
+                        chat_id=target,
+                        from_chat_id=source,
+                        message_id=first.id
+                    )]
+                logger.info(f"Copied to {chat_link}")
+            else:
+                sent_messages = await sender.forward_messages(
+                    chat_id=target,
+                    from_chat_id=source,
+                    message_ids=[msg_id for post in batch for msg_id in post.message_ids]
+                )
+                logger.info(f"Forwarded to {chat_link}")
+
+            elapsed = time.perf_counter() - started
+            metrics.observe("broadcaster_send_seconds", elapsed, account=sender.phone_number)
+            metrics.observe("broadcaster_destination_send_seconds", elapsed, destination=chat_link)
+            metrics.inc("broadcaster_sends_total", result="success")
+            sent_messages = [m for m in sent_messages or [] if m]
+            if sent_messages:
+                if scheduled:
+                    self.writes.update_last_msg_id(chat_link, sent_messages[-1].id)
+                for post_id, sent_id in map_sent_ids(batch, sent_messages).items():
+                    self.writes.add_to_history(post_id, sender.account_id, 'success', sent_id, chat_link, first.chat.id)
+                if self.sent is not None:
+                    for post in batch:
+                        self.sent.mark(chat_link, post)
+            logger.info(f"Post(s) {[post.id for post in batch]} sent to {chat_link} via {sender.phone_number}")
+            self.pacer.on_success(sender, chat_link)
+            await self.peers.remember(sender, chat_link)
+            return SENT, None
+
+        except FloodWait as e:
+            logger.warning(f"Account {sender.phone_number} got FloodWait for {e.value}s. Switching account.")
+            metrics.inc("broadcaster_sends_total", result="flood_wait")
+            metrics.inc("broadcaster_flood_waits_total", account=sender.phone_number)
+            metrics.inc("broadcaster_flood_wait_seconds_total", e.value, account=sender.phone_number)
+            self.pool.cool_down(sender, e.value)
+            self.pacer.on_flood_wait(sender, e.value)
+            return ACCOUNT, str(e)
+
+        except SlowmodeWait as e:
+            logger.warning(f"Slow mode in {chat_link}: {sender.phone_number} must wait {e.value}s.")
+            metrics.inc("broadcaster_sends_total", result="slowmode")
+            interval = None
+            if not self.pacer.slowmode(chat_link):
+                try:
+                    interval = await fetch_slowmode(sender, chat_link)
+                except Exception as fetch_error:
+                    logger.warning(f"Can't read slow mode of {chat_link}: {fetch_error}")
+            self.pacer.on_slowmode(sender, chat_link, e.value, interval)
+            return ACCOUNT, str(e)
+
+        except ACCOUNT_ERRORS as e:
+            logger.error(f"Account {sender.phone_number} is spam-limited ({type(e).__name__}). "
+                         f"Pausing it for {SPAM_COOLDOWN}s.")
+            metrics.inc("broadcaster_sends_total", result="spam_limited")
+            self.pool.cool_down(sender, SPAM_COOLDOWN)
+            return ACCOUNT, type(e).__name__
+
+        except MEMBERSHIP_ERRORS as e:
+            logger.error(f"Account {sender.phone_number} can't post to {chat_link}: {e}. Switching account.")
+            metrics.inc("broadcaster_sends_total", result="membership")
+            self.peers.invalidate(sender.account_id, chat_link)
+            return classify(e), type(e).__name__
+
+        except (UserDeactivated, AuthKeyUnregistered):
+            logger.error(f"Account {sender.phone_number} is DEAD! Removing from pool.")
+            metrics.inc("broadcaster_sends_total", result="dead")
+            await update_account_status(sender.phone_number, 'banned')
+            self.pool.remove(sender)
+            self.pacer.forget_account(sender)
+            return ACCOUNT, "account deactivated"
+
+        except Exception as e:
+            logger.error(f"Unknown error sending with {sender.phone_number}: {e}. Switching account.")
+            metrics.inc("broadcaster_sends_total", result="error")
+            return TRANSIENT, str(e)
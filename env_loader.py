@@ -6,10 +6,74 @@ load_dotenv()
 API_ID = int(os.getenv("API_ID", "placeholder_api_id"))
 API_HASH = os.getenv("API_HASH", "placeholder_hash")
 
+# Хранилище: mysql или sqlite (встроенная БД в файле SQLITE_PATH — для установки на одном сервере)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").strip().lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "broadcaster.db")
+
 DB_HOST=os.getenv("DB_HOST", "localhost")
 DB_USER=os.getenv("DB_USER", "root")
 DB_PORT=int(os.getenv("DB_PORT", "3306"))
 DB_PASS=os.getenv("DB_PASS", "")
 DB_NAME=os.getenv("DB_NAME", "telegram_forwarder")
 
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_HEALTHCHECK_INTERVAL = int(os.getenv("DB_HEALTHCHECK_INTERVAL", "60"))
+DB_RECONNECT_ATTEMPTS = int(os.getenv("DB_RECONNECT_ATTEMPTS", "3"))
+
+# Сколько чатов обслуживается параллельно
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "10"))
+
+# Кэш постов из источников
+CONTENT_POOL_SIZE = int(os.getenv("CONTENT_POOL_SIZE", "20"))
+CONTENT_MAX_AGE = int(os.getenv("CONTENT_MAX_AGE_HOURS", "0")) * 3600
+CONTENT_REFRESH_INTERVAL = int(os.getenv("CONTENT_REFRESH_INTERVAL", "300"))
+
+# Отложенная запись результатов в БД: по количеству изменений или раз в N секунд
+WRITE_BUFFER_SIZE = int(os.getenv("WRITE_BUFFER_SIZE", "100"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "5"))
+
+# Запуск клиентов: сколько подключать одновременно; ленивый режим — подключать аккаунт
+# только при первой отправке и отключать после LAZY_IDLE_TIMEOUT секунд простоя
+CLIENT_START_CONCURRENCY = int(os.getenv("CLIENT_START_CONCURRENCY", "10"))
+LAZY_CONNECT = os.getenv("LAZY_CONNECT", "0") == "1"
+LAZY_IDLE_TIMEOUT = int(os.getenv("LAZY_IDLE_TIMEOUT", "600"))
+
+# Шардинг: несколько инстансов на одной БД. Пустой INSTANCE_ID — работаем одни, без аренды чатов
+INSTANCE_ID = os.getenv("INSTANCE_ID", "")
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "300"))
+SHARD_SYNC_INTERVAL = int(os.getenv("SHARD_SYNC_INTERVAL", "60"))
+
+# Prometheus-эндпоинт /metrics (0 — выключен); по умолчанию доступен только локально
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Повторы постов: за последние DEDUP_WINDOW_HOURS часов в чат сначала идут еще не отправленные туда посты.
+# История старше HISTORY_RETENTION_DAYS дней удаляется (0 — хранить всё)
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW_HOURS", "72")) * 3600
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "30"))
+
+# Темп отправки: минимальная пауза (сек) между постами в один чат и между отправками одного аккаунта.
+# После FloodWait пауза аккаунта растет и постепенно возвращается к базовой; slow mode чатов учитывается сам
+PACER_DESTINATION_INTERVAL = float(os.getenv("PACER_DESTINATION_INTERVAL", "2"))
+PACER_ACCOUNT_INTERVAL = float(os.getenv("PACER_ACCOUNT_INTERVAL", "1"))
+
+# Чат, в который не может отправить ни один аккаунт, ставится на паузу: сразу при постоянных ошибках
+# (чат удален, ни у одного аккаунта нет прав) или после CIRCUIT_FAILURE_THRESHOLD сбоев подряд. Пауза от CIRCUIT_BASE_BACKOFF сек,
+# удваивается с каждым повтором, но не больше CIRCUIT_MAX_BACKOFF
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_BASE_BACKOFF = int(os.getenv("CIRCUIT_BASE_BACKOFF", "300"))
+CIRCUIT_MAX_BACKOFF = int(os.getenv("CIRCUIT_MAX_BACKOFF", "86400"))
+
+# Логи: уровень, формат консоли (text/json), файл в JSON с ротацией по размеру (пустой LOG_FILE — без файла).
+# Одно и то же сообщение пишется не больше LOG_SAMPLE_BURST раз за LOG_SAMPLE_INTERVAL секунд (ошибки — всегда)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_MB", "10")) * 1024 * 1024
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "60"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
\ No newline at end of file
@@ -1,4 +1,140 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
\ No newline at end of file
+from env_loader import (LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_SAMPLE_INTERVAL,
+                        LOG_SAMPLE_BURST)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" [+{record.suppressed} similar suppressed]"
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    # Ограничивает поток повторов: одно и то же сообщение (место в коде + итоговый текст) проходит
+    # не больше burst раз за interval секунд, остальные отбрасываются до записи в очередь.
+    # Разные сообщения с одной строки кода (отправки, FloodWait разных аккаунтов) не ограничиваются.
+    # Число отброшенных добавляется к первой записи следующего окна. ERROR и выше проходят всегда.
+
+    def __init__(self, interval, burst):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}  # {(pathname, lineno, message): [window_start, passed, suppressed]}
+        self._lock = threading.Lock()
+        self._cleaned_at = time.monotonic()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR or self.interval <= 0:
+            return True
+        key = (record.pathname, record.lineno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            self._cleanup(now)
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+    def _cleanup(self, now):
+        # Окна без отброшенных записей больше не нужны: иначе словарь растет с каждым новым текстом
+        if now - self._cleaned_at < self.interval:
+            return
+        self._cleaned_at = now
+        for key in [key for key, window in self._windows.items() if not window[2] and now - window[0] >= self.interval]:
+            del self._windows[key]
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    # Стандартный prepare склеивает traceback с текстом сообщения; оставляем его отдельным полем
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SafeQueueListener(logging.handlers.QueueListener):
+    # Повторный stop (atexit после ручной остановки перед рестартом) не должен падать
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def setup_logging():
+    # Логирование не блокирует event loop: запись уходит в очередь,
+    # а форматирование и ввод-вывод выполняет отдельный поток QueueListener
+    handlers = []
+
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else
+                         TextFormatter("%(asctime)s %(levelname)s:%(name)s:%(message)s"))
+    handlers.append(console)
+
+    if LOG_FILE:
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_INTERVAL, LOG_SAMPLE_BURST))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    listener = SafeQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем все, что осталось в очереди
+    atexit.register(listener.stop)
+    return listener
+
+
+listener = setup_logging()
+logger = logging.getLogger(__name__)
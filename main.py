@@ -1,102 +1,97 @@
 import asyncio
 import os
-import random
 import sys
-from datetime import datetime, timezone
 
-import aiomysql
 from pyrogram import Client, filters, enums
-from pyrogram.errors import FloodWait, UserDeactivated, AuthKeyUnregistered, SessionPasswordNeeded, PhoneCodeInvalid, PasswordHashInvalid
-
-from env_loader import DB_HOST, DB_PORT, DB_USER, DB_PASS, DB_NAME, API_ID, API_HASH, ADMIN_ID
-from log_config import logger
-
-DB_CONFIG = {
-    'host': DB_HOST,
-    'port': DB_PORT,
-    'user': DB_USER,
-    'password': DB_PASS,
-    'db': DB_NAME
-}
-
-HISTORY_LIMIT = 20
+from pyrogram.errors import SessionPasswordNeeded, PhoneCodeInvalid, PasswordHashInvalid
+
+from broadcaster import Broadcaster
+from db import (init_pool, close_pool, health_check_loop, save_new_account, get_active_sessions, get_sources,
+                get_destinations_full, revive_accounts, add_source, delete_source, save_destination,
+                delete_destination, set_send_mode)
+from env_loader import API_ID, API_HASH, ADMIN_ID, METRICS_PORT, METRICS_HOST, DISPATCH_CONCURRENCY
+from log_config import logger, listener as log_listener
+from manual_broadcast import ManualBroadcast, parse_post_link, fetch_post
+from metrics import metrics, format_stats, start_http_server
+from write_buffer import WriteBuffer
 
 auth_states = {}   # {user_id: "STATE"}
 temp_clients = {}  # {user_id: ClientObject}
 auth_data = {}     # {user_id: {"phone": str, "hash": str}}
 
-async def execute_query(query, params=None, fetch=None):
-    conn = await aiomysql.connect(**DB_CONFIG)
-    async with conn.cursor() as cur:
-        await cur.execute(query, params)
-        if fetch == 'all':
-            result = await cur.fetchall()
-        elif fetch == 'one':
-            result = await cur.fetchone()
-        else:
-            await conn.commit()
-            result = None
-    conn.close()
-    return result
+writes = WriteBuffer()
 
-async def save_new_account(phone, session_string):
-    await execute_query(
-        "INSERT INTO accounts (phone, session_string, status) VALUES (%s, %s, 'active')",
-        (phone, session_string)
-    )
 
-async def get_active_sessions():
-    return await execute_query("SELECT id, session_string, phone FROM accounts WHERE status = 'active'", fetch='all')
+async def restart_process():
+    await writes.stop()
+    await close_pool()
+    # execl не вызывает atexit — дописываем очередь логов сами
+    log_listener.stop()
+    os.execl(sys.executable, sys.executable, *sys.argv)
 
 
-async def get_sources():
-    rows = await execute_query("SELECT channel_link FROM sources", fetch='all')
-    return [row[0] for row in rows] if rows else []
-
+async def run_broadcaster():
+    await init_pool()
+    health_task = asyncio.create_task(health_check_loop())
+    writes.start()
+    metrics_server = await start_http_server(METRICS_PORT, METRICS_HOST) if METRICS_PORT else None
+    try:
+        await _run_broadcaster()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await writes.stop()
+        health_task.cancel()
+        await close_pool()
 
-async def get_destinations_full():
-    return await execute_query("SELECT chat_link, interval_minutes, last_sent_at, batch_size, send_mode, last_msg_id FROM destinations", fetch='all')
 
-async def update_last_msg_id(chat_link, msg_id):
-    await execute_query(
-        "UPDATE destinations SET last_msg_id = %s, last_sent_at = UTC_TIMESTAMP() WHERE chat_link = %s",
-        (msg_id, chat_link)
-    )
+async def _run_broadcaster():
+    await revive_accounts()
 
-async def update_last_sent_time(chat_link):
-    await execute_query("UPDATE destinations SET last_sent_at = UTC_TIMESTAMP() WHERE chat_link = %s", (chat_link,))
+    sessions = await get_active_sessions()
+    if not sessions:
+        logger.error("No active sessions found!")
+        return
 
+    bc = Broadcaster(writes)
+    for row in sessions:
+        bc.add_session(*row)
+    await bc.load()
 
-async def update_account_status(phone, status):
-    await execute_query("UPDATE accounts SET status = %s WHERE phone = %s", (status, phone))
+    logger.info("Starting clients...")
+    if await bc.start_clients() is None:
+        logger.error("No client could be started!")
+        return
+    register_admin_handlers(bc)
 
+    logger.info(f"Broadcaster is running... Admin client: {bc.admin_client.phone_number}")
 
-async def add_to_history(source_msg_id, account_id, status):
-    await execute_query("INSERT INTO history (source_message_id, account_id, status) VALUES (%s, %s, %s)",
-                        (source_msg_id, account_id, status))
+    try:
+        await bc.run()
+    finally:
+        await bc.stop()
 
 
-async def revive_accounts():
-    await execute_query(
-        "UPDATE accounts SET status = 'active' WHERE status = 'flood_wait' AND last_used < (NOW() - INTERVAL 30 MINUTE)")
+def register_admin_handlers(bc):
+    admin_client = bc.admin_client
+    pool = bc.pool
+    scheduler = bc.scheduler
+    content = bc.content
+    current_ad = None  # ManualBroadcast последней команды /send_ad
 
+    source_filter = filters.create(lambda _, __, message: content.accepts(message))
 
-async def run_broadcaster():
-    await revive_accounts()
+    @admin_client.on_message(source_filter, group=1)
+    async def source_post_handler(client, message):
+        content.feed(message)
 
-    sessions = await get_active_sessions()
-    if not sessions:
-        logger.error("No active sessions found!")
-        return
+    @admin_client.on_edited_message(source_filter, group=1)
+    async def source_edit_handler(client, message):
+        content.feed(message)
 
-    clients = []
-    for account_id, session_string, phone in sessions:
-        app = Client(f"client_{phone}", api_id=API_ID, api_hash=API_HASH, session_string=session_string, in_memory=True)
-        app.phone_number = phone
-        app.account_id = account_id
-        clients.append(app)
-
-    admin_client = clients[0]
+    @admin_client.on_deleted_messages(group=1)
+    async def source_delete_handler(client, messages):
+        content.discard(messages)
 
     @admin_client.on_message(filters.command("help") & filters.user(ADMIN_ID))
     async def help_cmd(client, message):
@@ -114,19 +109,41 @@ async def run_broadcaster():
             "<b>4️⃣ UTILITIES (УТИЛИТЫ)</b>\n"
             "<code>/add_account</code> — Добавить сессию аккаунта в список юзер-ботов (через авторизацию).\n"
             "<code>/list</code> — Список всех чатов и их настроек.\n"
-            "<code>/restart</code> — Перезагрузить всех ботов.\n"
+            "<code>/stats</code> — Задержки отправки, FloodWait по аккаунтам, время запросов к БД.\n"
+            "<code>/reload</code> — Применить изменения аккаунтов, источников и чатов из БД без перезапуска.\n"
+            "<code>/restart</code> — Полностью перезапустить процесс и всех ботов.\n"
             "<code>/delete @link</code> — Удалить чат из базы.\n"
-            "<code>/send_ad [link]</code> — Разовая рассылка поста вручную.\n\n"
+            "<code>/send_ad [link]</code> — Разовая рассылка поста вручную (прогресс обновляется в ответе).\n"
+            "<code>/cancel_ad</code> — Остановить разовую рассылку.\n\n"
             "<b>ℹ️ INFO:</b>\n"
-            "После добавления нового <b>источника</b> перезапустите бота на сервере. "
-            "Настройки <b>получателей</b> и <b>режимов</b> применяются мгновенно."
+            "Новые <b>аккаунты</b>, <b>источники</b>, настройки <b>получателей</b> и <b>режимов</b> применяются мгновенно, "
+            "перезапуск не нужен."
         )
         await message.reply(text, parse_mode=enums.ParseMode.HTML)
 
     @admin_client.on_message(filters.command("restart") & filters.user(ADMIN_ID))
     async def restart_cmd(client, message):
         await message.reply("🔄 Перезагрузка главного обработчика и всех юзер-ботов...")
-        os.execl(sys.executable, sys.executable, *sys.argv)
+        await restart_process()
+
+    @admin_client.on_message(filters.command("reload") & filters.user(ADMIN_ID))
+    async def reload_cmd(client, message):
+        try:
+            added, removed = await bc.reload_accounts()
+            await bc.reload_config()
+            await message.reply(
+                f"♻️ Конфигурация перечитана. Аккаунтов подключено: {added}, отключено: {removed}. "
+                f"Источников: {len(content.sources)}, чатов: {len(scheduler)}.")
+        except Exception as e:
+            logger.error(f"Reload error: {e}")
+            await message.reply(f"❌ Ошибка перезагрузки конфигурации: {e}")
+
+    @admin_client.on_message(filters.command("stats") & filters.user(ADMIN_ID))
+    async def stats_cmd(client, message):
+        text = format_stats(metrics)
+        text += (f"\n\n**Пул:** готово {pool.ready_count()}/{len(pool)} аккаунтов, "
+                 f"в рассылке {len(bc.dispatcher.active_links())} чатов, в буфере записи {len(writes)}")
+        await message.reply(text)
 
     @admin_client.on_message(filters.command("add_account") & filters.user(ADMIN_ID))
     async def add_account_start(client, message):
@@ -139,8 +156,9 @@ async def run_broadcaster():
         try:
             link = message.command[1]
             clean = link.replace("https://t.me/", "").replace("@", "").strip()
-            await execute_query("INSERT IGNORE INTO sources (channel_link) VALUES (%s)", (clean,))
-            await message.reply(f"✅ Source **{clean}** added (добавлен канал-вещатель)! Рекомендуется перезагрузить юзер-ботов для применения изменений (воспользуйтесь командой `/restart`)")
+            await add_source(clean)
+            content.add_source(clean)
+            await message.reply(f"✅ Source **{clean}** added (добавлен канал-вещатель)!")
         except:
             await message.reply("❌ Error. Usage: `/add_source @link`")
 
@@ -151,9 +169,9 @@ async def run_broadcaster():
             clean = link.replace("https://t.me/", "").replace("@", "").strip()
             interval = int(message.command[2]) if len(message.command) > 2 else 0
             batch = int(message.command[3]) if len(message.command) > 3 else 1
-            await execute_query(
-                "INSERT INTO destinations (chat_link, interval_minutes, batch_size) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE interval_minutes = %s, batch_size = %s",
-                (clean, interval, batch, interval, batch))
+            await save_destination(clean, interval, batch)
+            scheduler.upsert(clean, interval_minutes=interval, batch_size=batch)
+            bc.breaker.reset(clean)
             await message.reply(f"✅ Destination **{clean}** configured! Interval: {interval}m, Batch: {batch}")
         except:
             await message.reply("❌ Error. Usage: `/add_dest @link 60 3`")
@@ -163,9 +181,9 @@ async def run_broadcaster():
         srcs = await get_sources()
         dests = await get_destinations_full()
         text = "**📡 Sources:**\n" + "\n".join([f"• @{s}" for s in srcs])
-        text += "\n\n**📨 Destinations (Interval / Batch / Mode):**\n"
+        text += "\n\n**📨 Destinations (Interval / Batch / Mode / Health):**\n"
         for link, interval, _, batch, mode, _ in dests:
-            text += f"• @{link} (`{interval}` min / `{batch}` posts / `{mode}`)\n"
+            text += f"• @{link} (`{interval}` min / `{batch}` posts / `{mode}`) {bc.breaker.describe(link)}\n"
         await message.reply(text)
 
     @admin_client.on_message(filters.command("delete") & filters.user(ADMIN_ID))
@@ -173,8 +191,12 @@ async def run_broadcaster():
         try:
             link = message.command[1]
             clean = link.replace("https://t.me/", "").replace("@", "").strip()
-            await execute_query("DELETE FROM destinations WHERE chat_link = %s", (clean,))
-            await execute_query("DELETE FROM sources WHERE channel_link = %s", (clean,))
+            await delete_destination(clean)
+            scheduler.remove(clean)
+            bc.sent.forget(clean)
+            bc.breaker.reset(clean)
+            await delete_source(clean)
+            content.remove_source(clean)
             await message.reply(f"🗑 **{clean}** deleted from lists.")
         except:
             await message.reply("❌ Error. Usage: `/delete @link`")
@@ -186,7 +208,9 @@ async def run_broadcaster():
             mode = int(message.command[2])  # 0 или 1
             clean = link.replace("https://t.me/", "").replace("@", "").strip()
 
-            await execute_query("UPDATE destinations SET send_mode = %s WHERE chat_link = %s", (mode, clean))
+            await set_send_mode(clean, mode)
+            if clean in scheduler.destinations:
+                scheduler.upsert(clean, send_mode=mode)
             msg = "FORWARD (with buttons)" if mode == 0 else "COPY (no buttons)"
             await message.reply(f"✅ Mode for {clean} set to: {msg}")
         except:
@@ -194,38 +218,38 @@ async def run_broadcaster():
 
     @admin_client.on_message(filters.command("send_ad") & filters.user(ADMIN_ID))
     async def send_ad_cmd(client, message):
+        nonlocal current_ad
+        if current_ad is not None and current_ad.is_running():
+            await message.reply("⏳ Рассылка уже идет. Остановить: /cancel_ad")
+            return
         try:
-            link = message.command[1]
-            parts = link.split("/")
-            chat_username = parts[-2]
-            message_id = int(parts[-1])
-
-            await message.reply("🚀 Starting manual broadcast...")
-            dests = await get_destinations_full()
-
-            for dest_link, _, _, _, send_mode in dests:
-                sent = False
-                for sender in clients:
-                    try:
-
-                        if send_mode == 1:
-                            await sender.copy_message(chat_id=dest_link, from_chat_id=chat_username, message_id=message_id)
-                            logger.info(f"AD copied to {dest_link}")
-                        else:
-                            await sender.forward_messages(chat_id=dest_link, from_chat_id=chat_username,
-                                                      message_id=message_id)
-                            logger.info(f"AD forwarded to {dest_link}")
-
-                        sent = True
-                        await asyncio.sleep(2)
-                        break
-                    except Exception as e:
-                        logger.error(f"AD send error: {e}")
-                if not sent:
-                    logger.error(f"FAILED to send AD to {dest_link}")
-            await message.reply("🏁 Manual broadcast finished.")
+            chat_id, message_id = parse_post_link(message.command[1])
         except:
             await message.reply("❌ Error. Usage: `/send_ad https://t.me/channel/123`")
+            return
+
+        try:
+            post = await fetch_post(admin_client, chat_id, message_id)
+        except Exception as e:
+            logger.error(f"AD fetch error: {e}")
+            post = None
+        if post is None:
+            await message.reply("❌ Пост не найден или недоступен админ-аккаунту.")
+            return
+
+        destinations = [(dest.chat_link, dest.send_mode) for dest in scheduler.destinations.values()]
+        progress = await message.reply(f"🚀 Starting manual broadcast to {len(destinations)} chats...")
+        current_ad = ManualBroadcast(bc.dispatcher, writes, post, destinations, DISPATCH_CONCURRENCY)
+        current_ad.start(progress)
+        logger.info(f"Manual broadcast of post {message_id} started: {len(destinations)} chats")
+
+    @admin_client.on_message(filters.command("cancel_ad") & filters.user(ADMIN_ID))
+    async def cancel_ad_cmd(client, message):
+        if current_ad is None or not current_ad.is_running():
+            await message.reply("Нет активной рассылки.")
+            return
+        current_ad.cancel()
+        await message.reply("⛔ Рассылка остановлена.")
 
     @admin_client.on_message(filters.text & filters.user(ADMIN_ID))
     async def fsm_handler(client, message):
@@ -283,9 +307,9 @@ async def run_broadcaster():
                     del temp_clients[user_id]
                     del auth_data[user_id]
 
+                    await bc.reload_accounts()
                     await message.reply(
-                        f"✅ Аккаунт {phone} добавлен! Перезагружаю ботов для применения изменений... (2FA пароль для входа не требовался)")
-                    os.execl(sys.executable, sys.executable, *sys.argv)
+                        f"✅ Аккаунт {phone} добавлен и подключен к рассылке! (2FA пароль для входа не требовался)")
 
                 except SessionPasswordNeeded:
                     auth_states[user_id] = "WAITING_PASSWORD"
@@ -309,9 +333,9 @@ async def run_broadcaster():
                     del temp_clients[user_id]
                     del auth_data[user_id]
 
+                    await bc.reload_accounts()
                     await message.reply(
-                        f"✅ Верный 2FA пароль. Аккаунт {phone} добавлен! Перезагружаю бота для применения изменений...")
-                    os.execl(sys.executable, sys.executable, *sys.argv)
+                        f"✅ Верный 2FA пароль. Аккаунт {phone} добавлен и подключен к рассылке!")
 
                 except PasswordHashInvalid:
                     await message.reply("❌ Неверный пароль. Попробуйте еще раз.")
@@ -326,121 +350,6 @@ async def run_broadcaster():
             if user_id in auth_states:
                 del auth_states[user_id]
 
-    logger.info("Starting clients...")
-    for app in clients:
-        try:
-            await app.start()
-        except Exception as e:
-            logger.error(f"Failed to start {app.phone_number}: {e}")
-
-    logger.info("Broadcaster is running...")
-
-    while True:
-        try:
-            sources = await get_sources()
-            if not sources:
-                await asyncio.sleep(60)
-                continue
-
-            content_pool = []
-            try:
-                async for post in clients[0].get_chat_history(sources[0], limit=HISTORY_LIMIT):
-                    if post.reply_markup:
-                        content_pool.append(post)
-            except Exception as e:
-                logger.error(f"Error fetching history: {e}")
-
-            if not content_pool:
-                logger.warning("No valid content found. Waiting...")
-                await asyncio.sleep(60)
-                continue
-
-            destinations = await get_destinations_full()
-
-            for chat_link, interval, last_sent, batch_size, send_mode, last_msg_id in destinations:
-                time_to_wait = interval if interval > 0 else 1
-
-                if last_sent:
-                    delta = datetime.now(timezone.utc) - last_sent.replace(tzinfo=timezone.utc)
-                    minutes_passed = delta.total_seconds() / 60
-
-                    if minutes_passed < time_to_wait:
-                        logger.info(f"Skip {chat_link}: passed {int(minutes_passed)}/{time_to_wait} min.")
-                        continue
-
-                logger.info(f"Time to post in {chat_link}!")
-
-                # if last_msg_id:
-                #     for deleter in clients:
-                #         try:
-                #             await deleter.delete_messages(chat_link, last_msg_id)
-                #             logger.info(f"🗑 Deleted old msg {last_msg_id} in {chat_link}")
-                #             break
-                #         except Exception:
-                #             pass
-
-                posts_to_send = random.sample(content_pool, min(batch_size, len(content_pool)))
-
-                for post in posts_to_send:
-                    sent = False
-                    for sender in clients:
-                        if sent: break
-
-                        try:
-                            try:
-                                await sender.join_chat(chat_link)
-                            except:
-                                pass
-
-                            sent_msg = None
-
-                            if send_mode == 1:
-                                sent_msg = await sender.copy_message(
-                                    chat_id=chat_link,
-                                    from_chat_id=post.chat.id,
-                                    message_id=post.id
-                                )
-                                logger.info(f"Copied to {chat_link}")
-                            else:
-                                sent_msg = await sender.forward_messages(
-                                    chat_id=chat_link,
-                                    from_chat_id=post.chat.id,
-                                    message_ids=post.id
-                                )
-                                logger.info(f"Forwarded to {chat_link}")
-
-                            if sent_msg:
-                                await update_last_msg_id(chat_link, sent_msg.id)
-                                await add_to_history(post.id, sender.account_id, 'success')
-                            logger.info(f"Post {post.id} sent to {chat_link} via {sender.phone_number}")
-                            sent = True
-                            await asyncio.sleep(5)
-
-                        except FloodWait as e:
-                            logger.warning(
-                                f"Account {sender.phone_number} got FloodWait for {e.value}s. Switching account.")
-                            await update_account_status(sender.phone_number, 'flood_wait')
-
-                        except (UserDeactivated, AuthKeyUnregistered):
-                            logger.error(f"Account {sender.phone_number} is DEAD! Removing from pool.")
-                            await update_account_status(sender.phone_number, 'banned')
-                            if sender in clients:
-                                clients.remove(sender)
-
-                        except Exception as e:
-                            logger.error(f"Unknown error sending with {sender.phone_number}: {e}. Switching account.")
-                    if not sent:
-                        logger.critical(f"FAILED to send post {post.id} to {chat_link}")
-
-                if posts_to_send:
-                    await update_last_sent_time(chat_link)
-
-        except Exception as e:
-            logger.error(f"FATAL ERROR in main loop: {e}")
-
-        logger.info("Main loop finished. Sleeping for 60 seconds...")
-        await asyncio.sleep(60)
-
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+from content_pool import Post
+from log_config import logger
+
+PROGRESS_INTERVAL = 5  # как часто обновлять сообщение с прогрессом (сек)
+
+
+def parse_post_link(link):
+    # https://t.me/channel/123 или https://t.me/c/1234567890/123 (закрытый канал)
+    parts = link.rstrip("/").split("/")
+    message_id = int(parts[-1])
+    if len(parts) >= 3 and parts[-3] == "c":
+        return int(f"-100{parts[-2]}"), message_id
+    return parts[-2], message_id
+
+
+async def fetch_post(client, chat_id, message_id):
+    # Источником для отправителей служит то, что указано в ссылке: username резолвит любой аккаунт,
+    # а числовой id закрытого канала — только те, кто в нем состоит
+    message = await client.get_messages(chat_id, message_id)
+    if message is None or message.empty:
+        return None
+    if message.media_group_id:
+        return Post(await client.get_media_group(chat_id, message_id), source=chat_id)
+    return Post([message], source=chat_id)
+
+
+class ManualBroadcast:
+    # Разовая рассылка поста во все чаты: параллельно, не больше concurrency чатов одновременно,
+    # через тот же Dispatcher, что и плановая рассылка (пул аккаунтов, темп, slow mode, здоровье чатов).
+
+    def __init__(self, dispatcher, writes, post, destinations, concurrency):
+        self.dispatcher = dispatcher
+        self.writes = writes
+        self.post = post
+        self.destinations = destinations  # [(chat_link, send_mode)]
+        self.concurrency = concurrency
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = False
+        self._task = None
+        self._reporter = None
+
+    @property
+    def total(self):
+        return len(self.destinations)
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.skipped
+
+    @property
+    def rate(self):
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def is_running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, progress_message=None):
+        self.started_at = time.time()
+        self._task = asyncio.create_task(self._run())
+        if progress_message is not None:
+            self._reporter = asyncio.create_task(self._report(progress_message))
+        return self._task
+
+    def cancel(self):
+        if self.is_running():
+            self.cancelled = True
+            self._task.cancel()
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        try:
+            await asyncio.gather(*[self._send_one(slots, chat_link, send_mode)
+                                   for chat_link, send_mode in self.destinations])
+        finally:
+            self.finished_at = time.time()
+
+    async def _send_one(self, slots, chat_link, send_mode):
+        async with slots:
+            if not self.dispatcher.breaker.allow(chat_link):
+                self.skipped += 1
+                return
+            try:
+                sent = await self.dispatcher.send_batch(chat_link, send_mode, [self.post], scheduled=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"AD send error for {chat_link}: {e}")
+                sent = False
+            if sent:
+                self.sent += 1
+            else:
+                self.failed += 1
+                self.writes.add_to_history(self.post.id, None, 'failed', None, chat_link, self.post.chat.id)
+
+    def progress_text(self):
+        if self.cancelled:
+            title = "⛔ Рассылка остановлена"
+        elif self.is_running():
+            title = "🚀 Рассылка идет..."
+        else:
+            title = "🏁 Рассылка завершена"
+        text = (f"{title}\n"
+                f"Чатов: {self.done}/{self.total}\n"
+                f"✅ Отправлено: {self.sent}\n"
+                f"❌ Ошибок: {self.failed}")
+        if self.skipped:
+            text += f"\n⏸ Пропущено (чат на паузе): {self.skipped}"
+        text += f"\n⚡ {self.rate:.2f} posts/sec"
+        if self.is_running():
+            text += "\n\nОстановить: /cancel_ad"
+        return text
+
+    async def _report(self, message):
+        # Редактирует сообщение прогресса, пока рассылка не закончится
+        last_text = None
+        while True:
+            finished = not self.is_running()
+            text = self.progress_text()
+            if text != last_text:
+                try:
+                    await message.edit_text(text)
+                    last_text = text
+                except Exception as e:
+                    logger.warning(f"Can't update broadcast progress: {e}")
+            if finished:
+                return
+            await asyncio.wait([self._task], timeout=PROGRESS_INTERVAL)
@@ -0,0 +1,198 @@
+import asyncio
+import bisect
+import time
+from contextlib import contextmanager
+
+from log_config import logger
+
+# Границы корзин гистограмм (сек)
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        # Оценка сверху: граница корзины, в которую попал q-й процентиль
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+
+class Metrics:
+    # Счетчики и гистограммы в памяти процесса; ключ — (имя, метки)
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters = {}    # {(name, labels): float}
+        self.histograms = {}  # {(name, labels): Histogram}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def by_label(self, name, label):
+        # {значение метки: Histogram} для гистограмм с одной меткой
+        return {dict(labels)[label]: histogram for (metric, labels), histogram in self.histograms.items()
+                if metric == name and label in dict(labels)}
+
+    def counters_by_label(self, name, label):
+        return {dict(labels)[label]: value for (metric, labels), value in self.counters.items()
+                if metric == name and label in dict(labels)}
+
+    def total(self, name):
+        # Все гистограммы метрики, сведенные в одну
+        merged = Histogram()
+        for (metric, _), histogram in self.histograms.items():
+            if metric != name:
+                continue
+            merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+            merged.count += histogram.count
+            merged.sum += histogram.sum
+            merged.max = max(merged.max, histogram.max)
+        return merged
+
+    def render_prometheus(self):
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+        lines.append("# TYPE broadcaster_uptime_seconds gauge")
+        lines.append(f"broadcaster_uptime_seconds {time.time() - self.started_at:.0f}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_histogram(title, histogram):
+    return (f"{title}: {histogram.count} шт., avg {histogram.avg:.2f}s, "
+            f"p95 ≤{histogram.quantile(0.95):.2f}s, max {histogram.max:.2f}s")
+
+
+def format_stats(metrics, top=10):
+    uptime = int(time.time() - metrics.started_at)
+    results = metrics.counters_by_label("broadcaster_sends_total", "result")
+    lines = [
+        "📊 **Статистика**",
+        f"Uptime: {uptime // 3600}h {uptime % 3600 // 60}m",
+        "Отправки: " + (", ".join(f"{result} {int(count)}" for result, count in sorted(results.items())) or "нет"),
+        "",
+        _format_histogram("Send RPC", metrics.total("broadcaster_send_seconds")),
+        _format_histogram("DB query", metrics.total("broadcaster_db_query_seconds")),
+        _format_histogram("History fetch", metrics.total("broadcaster_history_fetch_seconds")),
+    ]
+
+    floods = metrics.counters_by_label("broadcaster_flood_waits_total", "account")
+    flood_seconds = metrics.counters_by_label("broadcaster_flood_wait_seconds_total", "account")
+    accounts = metrics.by_label("broadcaster_send_seconds", "account")
+    if accounts or floods:
+        lines.append("\n**Аккаунты:**")
+        for account in sorted(set(accounts) | set(floods), key=lambda a: -floods.get(a, 0)):
+            histogram = accounts.get(account, Histogram())
+            line = f"`{account}`: {histogram.count} отпр., avg {histogram.avg:.2f}s"
+            if floods.get(account):
+                line += f", FloodWait {int(floods[account])} раз / {int(flood_seconds.get(account, 0))}s"
+            lines.append(line)
+
+    destinations = metrics.by_label("broadcaster_destination_send_seconds", "destination")
+    if destinations:
+        lines.append(f"\n**Самые медленные чаты (top {top}, p95):**")
+        slowest = sorted(destinations.items(), key=lambda item: -item[1].quantile(0.95))[:top]
+        for destination, histogram in slowest:
+            lines.append(f"`{destination}`: p95 ≤{histogram.quantile(0.95):.2f}s, {histogram.count} отпр.")
+
+    text = "\n".join(lines)
+    # Лимит длины сообщения Telegram
+    return text if len(text) <= 4000 else text[:4000] + "\n…"
+
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        path = request_line.split()[1] if len(request_line.split()) > 1 else b"/"
+        if path == b"/metrics":
+            status, body = "200 OK", metrics.render_prometheus().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except Exception as e:
+        logger.error(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+
+async def start_http_server(port, host="127.0.0.1"):
+    # Prometheus-эндпоинт /metrics; по умолчанию слушает только localhost
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return server
+
+
+metrics = Metrics()
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+
+import db_mysql
+import db_sqlite
+from log_config import logger
+
+BACKENDS = {"mysql": db_mysql, "sqlite": db_sqlite}
+
+# Порядок важен: history и peer_cache ссылаются на accounts. id переносятся как есть
+TABLES = [
+    ("accounts", ("id", "phone", "session_string", "status", "flood_until", "last_used", "instance_id")),
+    ("sources", ("id", "channel_link")),
+    ("destinations", ("id", "chat_link", "interval_minutes", "batch_size", "last_sent_at", "send_mode",
+                      "last_msg_id", "lease_owner", "lease_expires_at")),
+    ("history", ("id", "source_message_id", "sent_message_id", "account_id", "status", "destination",
+                 "source_chat_id", "created_at")),
+    ("peer_cache", ("account_id", "chat_link", "peer_id", "access_hash", "peer_type", "is_member", "updated_at")),
+]
+
+CHUNK_SIZE = 5000  # строк за один SELECT / executemany
+
+
+async def fetch(backend, query, params=None):
+    async def operation(conn):
+        async with conn.cursor() as cur:
+            await cur.execute(query, params)
+            return await cur.fetchall()
+
+    return await backend.run(operation)
+
+
+async def insert(backend, query, rows):
+    async def operation(conn):
+        await conn.begin()
+        try:
+            async with conn.cursor() as cur:
+                await cur.executemany(query, rows)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+    await backend.run(operation)
+
+
+async def read_chunks(backend, table, columns):
+    # Таблицы с id читаем по ключу, а не через OFFSET: history может быть большой
+    if columns[0] != "id":
+        yield await fetch(backend, f"SELECT {', '.join(columns)} FROM {table}")
+        return
+    last_id = 0
+    while True:
+        rows = await fetch(backend, f"SELECT {', '.join(columns)} FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+                           (last_id, CHUNK_SIZE))
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+async def migrate(source, target):
+    # Целевая БД должна быть пустой, иначе id из источника столкнутся с уже существующими
+    for table, _ in TABLES:
+        count = (await fetch(target, f"SELECT COUNT(*) FROM {table}"))[0][0]
+        if count:
+            raise RuntimeError(f"Target table {table} is not empty ({count} rows)")
+
+    for table, columns in TABLES:
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        copied = 0
+        async for rows in read_chunks(source, table, columns):
+            await insert(target, query, rows)
+            copied += len(rows)
+        logger.info(f"{table}: {copied} rows copied")
+
+
+async def main(args):
+    source, target = BACKENDS[args.source], BACKENDS[args.target]
+    try:
+        # Схема SQLite создается при открытии; для MySQL сначала выполните setup_database.sql
+        await source.init_pool()
+        await target.init_pool()
+        await migrate(source, target)
+        logger.info(f"Migration {args.source} -> {args.target} finished. "
+                     f"Set DB_BACKEND={args.target} in .env and restart the bot")
+    finally:
+        await source.close_pool()
+        await target.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Перенос данных между MySQL и SQLite. Бот на время переноса должен быть остановлен. "
+                    "Время копируется как есть: MySQL должен работать в UTC (time_zone = '+00:00')")
+    parser.add_argument("--from", dest="source", choices=BACKENDS, required=True)
+    parser.add_argument("--to", dest="target", choices=BACKENDS, required=True)
+    args = parser.parse_args()
+    if args.source == args.target:
+        parser.error("--from и --to должны различаться")
+    asyncio.run(main(args))
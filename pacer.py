@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+from pyrogram import raw
+
+from log_config import logger
+
+MIN_RATE = 1 / 300   # нижняя граница скорости: один пост в 5 минут
+RECOVERY_STEP = 0.1  # доля базовой скорости, которую возвращает каждая успешная отправка
+
+
+class TokenBucket:
+    # Токены резервируются заранее: reserve() сразу возвращает, сколько ждать своей очереди,
+    # поэтому параллельные отправки в один чат выстраиваются друг за другом без гонок
+
+    def __init__(self, rate, burst=1):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def slow_down(self, factor=0.5):
+        self._refill(time.monotonic())
+        self.rate = max(MIN_RATE, self.rate * factor)
+
+    def speed_up(self):
+        self._refill(time.monotonic())
+        self.rate = min(self.base_rate, self.rate + self.base_rate * RECOVERY_STEP)
+
+
+class Pacer:
+    # Темп отправки: ведро токенов на каждый чат и на каждый аккаунт.
+    # FloodWait вдвое снижает скорость аккаунта, успешные отправки постепенно возвращают ее.
+    # Slow mode чата запоминается по SlowmodeWait и данным чата: аккаунт не пишет в чат чаще, чем там разрешено.
+
+    def __init__(self, destination_interval, account_interval):
+        self.destination_rate = 1 / destination_interval if destination_interval > 0 else None
+        self.account_rate = 1 / account_interval if account_interval > 0 else None
+        self._destinations = {}   # {chat_link: TokenBucket}
+        self._accounts = {}       # {account_id: TokenBucket}
+        self._slowmode = {}       # {chat_link: сек}
+        self._blocked_until = {}  # {(account_id, chat_link): monotonic time}
+
+    def _bucket(self, buckets, key, rate):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate)
+        return bucket
+
+    async def wait_destination(self, chat_link):
+        if self.destination_rate is None:
+            return
+        delay = self._bucket(self._destinations, chat_link, self.destination_rate).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def wait_account(self, client):
+        if self.account_rate is None:
+            return
+        delay = self._bucket(self._accounts, client.account_id, self.account_rate).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def blocked(self, chat_link, clients):
+        # Аккаунты, которым slow mode чата пока не дает писать
+        now = time.monotonic()
+        for key in [key for key, until in self._blocked_until.items() if until <= now]:
+            del self._blocked_until[key]
+        return {client for client in clients if (client.account_id, chat_link) in self._blocked_until}
+
+    def next_unblock(self, chat_link, clients):
+        # Через сколько секунд освободится первый из аккаунтов (None — никто из них не заблокирован)
+        now = time.monotonic()
+        waits = [self._blocked_until[(client.account_id, chat_link)] - now for client in clients
+                 if self._blocked_until.get((client.account_id, chat_link), 0) > now]
+        return min(waits) if waits else None
+
+    def slowmode(self, chat_link):
+        return self._slowmode.get(chat_link, 0)
+
+    def on_success(self, client, chat_link):
+        if client.account_id in self._accounts:
+            self._accounts[client.account_id].speed_up()
+        slowmode = self._slowmode.get(chat_link)
+        if slowmode:
+            self._blocked_until[(client.account_id, chat_link)] = time.monotonic() + slowmode
+
+    def on_flood_wait(self, client, seconds):
+        if self.account_rate is not None:
+            bucket = self._bucket(self._accounts, client.account_id, self.account_rate)
+            bucket.slow_down()
+            logger.info(f"Account {client.phone_number} pace lowered to one send per {1 / bucket.rate:.0f}s")
+
+    def on_slowmode(self, client, chat_link, seconds, interval=None):
+        # seconds — сколько осталось ждать этому аккаунту; interval — slow mode чата, если известен
+        self._blocked_until[(client.account_id, chat_link)] = time.monotonic() + seconds
+        learned = max(self._slowmode.get(chat_link, 0), interval or seconds)
+        if learned != self._slowmode.get(chat_link):
+            self._slowmode[chat_link] = learned
+            logger.info(f"Slow mode in {chat_link}: {learned}s per account")
+
+    def forget_account(self, client):
+        self._accounts.pop(client.account_id, None)
+        for key in [key for key in self._blocked_until if key[0] == client.account_id]:
+            del self._blocked_until[key]
+
+
+async def fetch_slowmode(client, chat_link):
+    # Slow mode есть только у супергрупп; интервал лежит в полной информации о канале
+    peer = await client.resolve_peer(chat_link)
+    if not isinstance(peer, raw.types.InputPeerChannel):
+        return None
+    full = await client.invoke(raw.functions.channels.GetFullChannel(
+        channel=raw.types.InputChannel(channel_id=peer.channel_id, access_hash=peer.access_hash)))
+    return getattr(full.full_chat, "slowmode_seconds", None) or None
@@ -0,0 +1,108 @@
+import asyncio
+
+from pyrogram import raw, utils
+
+from db import execute_query, dialect
+from log_config import logger
+
+
+def _peer_from_input(input_peer):
+    # InputPeer -> (peer_id, access_hash, peer_type) в формате внутреннего хранилища Pyrogram
+    if isinstance(input_peer, raw.types.InputPeerChannel):
+        return utils.get_channel_id(input_peer.channel_id), input_peer.access_hash, "channel"
+    if isinstance(input_peer, raw.types.InputPeerChat):
+        return -input_peer.chat_id, 0, "group"
+    if isinstance(input_peer, raw.types.InputPeerUser):
+        return input_peer.user_id, input_peer.access_hash, "user"
+    return None
+
+
+def _username(chat_link):
+    # Приватные ссылки (+hash, joinchat/...) username не являются
+    if chat_link.startswith("+") or "/" in chat_link:
+        return None
+    return chat_link.lower()
+
+
+class PeerEntry:
+    def __init__(self, peer_id, access_hash, peer_type, is_member=True):
+        self.peer_id = peer_id
+        self.access_hash = access_hash
+        self.peer_type = peer_type
+        self.is_member = is_member
+
+
+class PeerCache:
+    # Кэш (account_id, chat_link) -> резолв чата и факт членства.
+    # Хранится в таблице peer_cache и подкладывается в in-memory хранилище каждого клиента,
+    # чтобы после рестарта не резолвить username и не вступать в чат повторно.
+    # Каналы-источники лежат здесь же (по username): для них это просто кэш резолва.
+
+    def __init__(self):
+        self._entries = {}  # {(account_id, chat_link): PeerEntry}
+        self._tasks = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def load(self):
+        rows = await execute_query(
+            "SELECT account_id, chat_link, peer_id, access_hash, peer_type, is_member FROM peer_cache", fetch='all')
+        for account_id, chat_link, peer_id, access_hash, peer_type, is_member in rows or []:
+            self._entries[(account_id, chat_link)] = PeerEntry(peer_id, access_hash, peer_type, bool(is_member))
+        logger.info(f"Peer cache loaded: {len(self._entries)} entries")
+
+    async def prime(self, client):
+        peers = []
+        for (account_id, chat_link), entry in self._entries.items():
+            if account_id == client.account_id:
+                peers.append((entry.peer_id, entry.access_hash, entry.peer_type, _username(chat_link), None))
+        if peers:
+            await client.storage.update_peers(peers)
+
+    def is_member(self, account_id, chat_link):
+        entry = self._entries.get((account_id, chat_link))
+        return entry is not None and entry.is_member
+
+    def target(self, account_id, chat_link):
+        # Известный peer_id уже лежит в хранилище клиента (см. prime) — отправка без резолва
+        entry = self._entries.get((account_id, chat_link))
+        return entry.peer_id if entry is not None else chat_link
+
+    async def remember(self, client, chat_link):
+        key = (client.account_id, chat_link)
+        if self.is_member(*key):
+            return
+        try:
+            # После join/send чат уже лежит в хранилище клиента — RPC здесь не будет
+            peer = _peer_from_input(await client.resolve_peer(chat_link))
+        except Exception as e:
+            logger.warning(f"Can't resolve {chat_link} for cache: {e}")
+            return
+        if peer is None:
+            return
+
+        self._entries[key] = PeerEntry(*peer)
+        self._run(execute_query(
+            dialect.upsert("peer_cache", ("account_id", "chat_link", "peer_id", "access_hash", "peer_type", "is_member"),
+                           ("account_id", "chat_link"), ("peer_id", "access_hash", "peer_type", "is_member")),
+            (client.account_id, chat_link, *peer, 1)
+        ))
+
+    def invalidate(self, account_id, chat_link):
+        if self._entries.pop((account_id, chat_link), None) is None:
+            return
+        self._run(execute_query(
+            "DELETE FROM peer_cache WHERE account_id = %s AND chat_link = %s", (account_id, chat_link)))
+
+    def _run(self, coro):
+        task = asyncio.create_task(self._safe(coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _safe(coro):
+        try:
+            await coro
+        except Exception as e:
+            logger.error(f"Peer cache write failed: {e}")
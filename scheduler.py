@@ -0,0 +1,143 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import timezone
+
+
+class Destination:
+    def __init__(self, chat_link, interval_minutes=1, last_sent_at=None, batch_size=1, send_mode=0, last_msg_id=None):
+        self.chat_link = chat_link
+        self.interval_minutes = interval_minutes
+        self.last_sent_at = last_sent_at  # unix time
+        self.batch_size = batch_size
+        self.send_mode = send_mode
+        self.last_msg_id = last_msg_id
+
+    @classmethod
+    def from_row(cls, row):
+        chat_link, interval, last_sent, batch_size, send_mode, last_msg_id = row
+        if last_sent is not None:
+            last_sent = last_sent.replace(tzinfo=timezone.utc).timestamp()
+        return cls(chat_link, interval, last_sent, batch_size, send_mode, last_msg_id)
+
+    @property
+    def interval_seconds(self):
+        return (self.interval_minutes if self.interval_minutes > 0 else 1) * 60
+
+    def next_due(self):
+        if self.last_sent_at is None:
+            return time.time()
+        return self.last_sent_at + self.interval_seconds
+
+
+class DueScheduler:
+    # Куча (due_at, seq, chat_link). Устаревшие записи не удаляются из кучи,
+    # а пропускаются: актуальная запись для чата хранится в self._entries.
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}       # {chat_link: [due_at, seq, chat_link]}
+        self.destinations = {}   # {chat_link: Destination}
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    def __len__(self):
+        return len(self.destinations)
+
+    def load(self, rows):
+        for row in rows or []:
+            dest = Destination.from_row(row)
+            self.destinations[dest.chat_link] = dest
+            self.schedule(dest.chat_link, dest.next_due())
+
+    def sync(self, rows, refresh_times=False):
+        # Перечитанная из БД конфигурация: время последней отправки в памяти не трогаем,
+        # кроме refresh_times — в чаты мог отправить другой инстанс, берем более позднее время
+        seen = set()
+        for row in rows or []:
+            dest = Destination.from_row(row)
+            seen.add(dest.chat_link)
+            current = self.destinations.get(dest.chat_link)
+            if current is None:
+                self.destinations[dest.chat_link] = dest
+                self.schedule(dest.chat_link, dest.next_due())
+                continue
+            fields = dict(interval_minutes=dest.interval_minutes, batch_size=dest.batch_size,
+                          send_mode=dest.send_mode)
+            if refresh_times and dest.last_sent_at and (current.last_sent_at or 0) < dest.last_sent_at:
+                fields["last_sent_at"] = dest.last_sent_at
+            self.upsert(dest.chat_link, **fields)
+        for chat_link in list(self.destinations):
+            if chat_link not in seen:
+                self.remove(chat_link)
+
+    def schedule(self, chat_link, due_at):
+        if chat_link not in self.destinations:
+            return
+        entry = [due_at, next(self._seq), chat_link]
+        self._entries[chat_link] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._changed.set()
+
+    def upsert(self, chat_link, **fields):
+        dest = self.destinations.get(chat_link)
+        if dest is None:
+            dest = self.destinations[chat_link] = Destination(chat_link)
+            self._entries[chat_link] = None
+        for name, value in fields.items():
+            setattr(dest, name, value)
+        # Чат сейчас в рассылке — новое время посчитает mark_sent
+        if chat_link in self._entries:
+            self.schedule(chat_link, dest.next_due())
+        return dest
+
+    def remove(self, chat_link):
+        self.destinations.pop(chat_link, None)
+        self._entries.pop(chat_link, None)
+        self._changed.set()
+
+    def mark_sent(self, chat_link, sent_at=None):
+        dest = self.destinations.get(chat_link)
+        if dest is None:
+            return
+        dest.last_sent_at = sent_at or time.time()
+        self.schedule(chat_link, dest.next_due())
+
+    def retry(self, chat_links, delay):
+        due_at = time.time() + delay
+        for chat_link in chat_links:
+            self.schedule(chat_link, due_at)
+
+    def _pop_stale(self):
+        while self._heap and self._entries.get(self._heap[0][2]) is not self._heap[0]:
+            heapq.heappop(self._heap)
+
+    async def wait_due(self):
+        # Спит ровно до ближайшего дедлайна; изменения кучи будят раньше
+        while True:
+            self._pop_stale()
+            self._changed.clear()
+
+            if not self._heap:
+                await self._changed.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if self._entries.get(entry[2]) is entry:
+                    del self._entries[entry[2]]
+                    due.append(self.destinations[entry[2]])
+            if due:
+                return due
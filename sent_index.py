@@ -0,0 +1,113 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict
+
+from db import execute_query, execute_in_transaction, dialect
+from log_config import logger
+
+PRUNE_CHUNK = 10000  # строк history за один DELETE, чтобы не держать долгую блокировку
+
+
+class SentIndex:
+    # Что и когда уже отправлялось в каждый чат: {chat_link: {(source_chat_id, source_message_id): sent_at}}.
+    # Загружается из history при старте, дальше пополняется после каждой успешной отправки.
+
+    def __init__(self, window, retention_days=0, prune_interval=3600, max_per_destination=1000):
+        self.window = window                  # сек; старые отправки не мешают повтору
+        self.retention_days = retention_days  # 0 — history не чистится
+        self.prune_interval = prune_interval
+        self.max_per_destination = max_per_destination
+        self._sent = {}
+        self._task = None
+
+    def __len__(self):
+        return sum(len(sent) for sent in self._sent.values())
+
+    async def load(self):
+        rows = await execute_query(
+            f"SELECT destination, source_chat_id, source_message_id, {dialect.unix_time('created_at')} FROM history "
+            "WHERE status = 'success' AND destination IS NOT NULL "
+            f"AND created_at >= {dialect.shift(dialect.CURRENT, '-%s')} "
+            "ORDER BY id",
+            (int(self.window),), fetch='all')
+        for destination, source_chat_id, source_message_id, sent_at in rows or []:
+            self._remember(destination, (source_chat_id, source_message_id), float(sent_at))
+        logger.info(f"Sent index loaded: {len(self)} posts in {len(self._sent)} destinations")
+
+    def mark(self, destination, post):
+        self._remember(destination, (post.chat.id, post.id), time.time())
+
+    def was_sent(self, destination, post):
+        sent_at = self._sent.get(destination, {}).get((post.chat.id, post.id))
+        return sent_at is not None and sent_at > time.time() - self.window
+
+    def forget(self, destination):
+        self._sent.pop(destination, None)
+
+    def choose(self, destination, posts, count):
+        # Сначала еще не отправленные в этот чат посты, недостающие — самые давно отправленные
+        count = min(count, len(posts))
+        fresh = [post for post in posts if not self.was_sent(destination, post)]
+        if len(fresh) >= count:
+            return random.sample(fresh, count)
+        sent = self._sent.get(destination, {})
+        repeats = sorted((post for post in posts if self.was_sent(destination, post)),
+                         key=lambda post: sent[(post.chat.id, post.id)])
+        return fresh + repeats[:count - len(fresh)]
+
+    def _remember(self, destination, key, sent_at):
+        # source_chat_id у строк из старой схемы нет — такие строки не сопоставить с постом
+        if key[0] is None:
+            return
+        sent = self._sent.setdefault(destination, OrderedDict())
+        sent[key] = sent_at
+        sent.move_to_end(key)
+        while len(sent) > self.max_per_destination:
+            sent.popitem(last=False)
+
+    def _evict_expired(self):
+        border = time.time() - self.window
+        for destination in list(self._sent):
+            sent = self._sent[destination]
+            while sent and next(iter(sent.values())) <= border:
+                sent.popitem(last=False)
+            if not sent:
+                del self._sent[destination]
+
+    async def prune(self):
+        # Удаляет из history строки старше retention_days порциями по PRUNE_CHUNK
+        async def delete_chunk(cur):
+            await cur.execute(
+                dialect.delete_limited("history", f"created_at < {dialect.shift(dialect.CURRENT, '-86400 * %s')}"),
+                (self.retention_days, PRUNE_CHUNK))
+            return cur.rowcount
+
+        total = 0
+        while True:
+            deleted = await execute_in_transaction(delete_chunk)
+            total += deleted
+            if deleted < PRUNE_CHUNK:
+                return total
+            await asyncio.sleep(0)
+
+    async def _prune_loop(self):
+        while True:
+            self._evict_expired()
+            if self.retention_days:
+                try:
+                    deleted = await self.prune()
+                    if deleted:
+                        logger.info(f"History pruned: {deleted} rows older than {self.retention_days} days")
+                except Exception as e:
+                    logger.error(f"History pruning failed: {e}")
+            await asyncio.sleep(self.prune_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._prune_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
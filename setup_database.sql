@@ -4,7 +4,9 @@ CREATE TABLE IF NOT EXISTS accounts (
     phone VARCHAR(20) NOT NULL UNIQUE,
     session_string TEXT,
     status ENUM('active', 'banned', 'flood_wait') DEFAULT 'active',
-    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    flood_until TIMESTAMP NULL DEFAULT NULL,
+    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    instance_id VARCHAR(64) NULL DEFAULT NULL
 );
 
 -- Таблица источников
@@ -21,15 +23,35 @@ CREATE TABLE IF NOT EXISTS destinations (
     batch_size INT DEFAULT 1,
     last_sent_at TIMESTAMP NULL DEFAULT NULL,
     send_mode INT DEFAULT 0,
-    last_msg_id INT DEFAULT NULL
+    last_msg_id INT DEFAULT NULL,
+    lease_owner VARCHAR(64) NULL DEFAULT NULL,
+    lease_expires_at TIMESTAMP NULL DEFAULT NULL
 );
 
 -- История рассылок
 CREATE TABLE IF NOT EXISTS history (
     id INT AUTO_INCREMENT PRIMARY KEY,
     source_message_id INT NOT NULL,
+    sent_message_id INT DEFAULT NULL,
     account_id INT,
     status VARCHAR(20),
+    destination VARCHAR(100) DEFAULT NULL,
+    source_chat_id BIGINT DEFAULT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (account_id) REFERENCES accounts(id)
+    FOREIGN KEY (account_id) REFERENCES accounts(id),
+    INDEX idx_history_destination (destination, source_message_id),
+    INDEX idx_history_created_at (created_at)
+);
+
+-- Кэш резолва чатов и членства аккаунтов в них
+CREATE TABLE IF NOT EXISTS peer_cache (
+    account_id INT NOT NULL,
+    chat_link VARCHAR(100) NOT NULL,
+    peer_id BIGINT NOT NULL,
+    access_hash BIGINT NOT NULL DEFAULT 0,
+    peer_type VARCHAR(16) NOT NULL,
+    is_member TINYINT(1) NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, chat_link),
+    FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE
 );
\ No newline at end of file
@@ -0,0 +1,66 @@
+-- Схема для DB_BACKEND=sqlite. Применяется автоматически при запуске (db_sqlite.init_pool).
+-- Время хранится строками 'YYYY-MM-DD HH:MM:SS' в UTC.
+
+-- Таблица аккаунтов
+CREATE TABLE IF NOT EXISTS accounts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    phone VARCHAR(20) NOT NULL UNIQUE,
+    session_string TEXT,
+    status TEXT DEFAULT 'active' CHECK (status IN ('active', 'banned', 'flood_wait')),
+    flood_until TIMESTAMP NULL DEFAULT NULL,
+    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    instance_id VARCHAR(64) NULL DEFAULT NULL
+);
+
+-- Таблица источников
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_link VARCHAR(100) NOT NULL UNIQUE
+);
+
+-- Таблица получателей
+CREATE TABLE IF NOT EXISTS destinations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_link VARCHAR(100) NOT NULL UNIQUE,
+    interval_minutes INTEGER DEFAULT 1,
+    batch_size INTEGER DEFAULT 1,
+    last_sent_at TIMESTAMP NULL DEFAULT NULL,
+    send_mode INTEGER DEFAULT 0,
+    last_msg_id INTEGER DEFAULT NULL,
+    lease_owner VARCHAR(64) NULL DEFAULT NULL,
+    lease_expires_at TIMESTAMP NULL DEFAULT NULL
+);
+
+-- История рассылок
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_message_id INTEGER NOT NULL,
+    sent_message_id INTEGER DEFAULT NULL,
+    account_id INTEGER REFERENCES accounts(id),
+    status VARCHAR(20),
+    destination VARCHAR(100) DEFAULT NULL,
+    source_chat_id BIGINT DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_history_destination ON history (destination, source_message_id);
+CREATE INDEX IF NOT EXISTS idx_history_created_at ON history (created_at);
+
+-- Кэш резолва чатов и членства аккаунтов в них
+CREATE TABLE IF NOT EXISTS peer_cache (
+    account_id INTEGER NOT NULL REFERENCES accounts(id) ON DELETE CASCADE,
+    chat_link VARCHAR(100) NOT NULL,
+    peer_id BIGINT NOT NULL,
+    access_hash BIGINT NOT NULL DEFAULT 0,
+    peer_type VARCHAR(16) NOT NULL,
+    is_member INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, chat_link)
+);
+
+-- Аналог ON UPDATE CURRENT_TIMESTAMP из MySQL
+CREATE TRIGGER IF NOT EXISTS peer_cache_updated_at AFTER UPDATE ON peer_cache
+BEGIN
+    UPDATE peer_cache SET updated_at = CURRENT_TIMESTAMP
+    WHERE account_id = NEW.account_id AND chat_link = NEW.chat_link;
+END;
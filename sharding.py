@@ -0,0 +1,112 @@
+import asyncio
+from datetime import timezone
+
+from db import execute_query, execute_in_transaction, dialect
+from log_config import logger
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+class LeaseManager:
+    # Несколько инстансов рассыльщика на одной БД: чат рассылает только тот инстанс,
+    # который взял на него аренду (lease_owner / lease_expires_at в destinations).
+    # Аренда продлевается, пока идет рассылка; если инстанс упал — она истекает сама.
+
+    def __init__(self, instance_id, lease_seconds):
+        self.instance_id = instance_id
+        self.lease_seconds = lease_seconds
+        self._task = None
+
+    async def claim(self, chat_links):
+        # Берем только чаты, которые свободны и все еще должны быть отправлены по данным БД:
+        # другой инстанс мог уже разослать их, пока наш таймер шел по старому last_sent_at
+        chat_links = list(chat_links)
+        if not chat_links:
+            return set()
+
+        # Чат снова пора отправлять, если с last_sent_at прошло interval_minutes (не меньше минуты)
+        due_border = dialect.shift(dialect.UTC_NOW, f"-60 * {dialect.greatest('interval_minutes', '1')}")
+
+        async def callback(cur):
+            await cur.execute(
+                "SELECT chat_link FROM destinations "
+                f"WHERE chat_link IN ({_placeholders(chat_links)}) "
+                f"AND (lease_owner IS NULL OR lease_owner = %s OR lease_expires_at <= {dialect.UTC_NOW}) "
+                "AND (last_sent_at IS NULL "
+                f"OR last_sent_at <= {due_border}){dialect.LOCK_ROWS}",
+                (*chat_links, self.instance_id))
+            claimed = [row[0] for row in await cur.fetchall()]
+            if claimed:
+                await cur.execute(
+                    "UPDATE destinations SET lease_owner = %s, "
+                    f"lease_expires_at = {dialect.shift(dialect.UTC_NOW, '%s')} "
+                    f"WHERE chat_link IN ({_placeholders(claimed)})",
+                    (self.instance_id, self.lease_seconds, *claimed))
+            return set(claimed)
+
+        return await execute_in_transaction(callback)
+
+    async def last_sent_times(self, chat_links):
+        # {chat_link: unix time} — актуальное время отправки для чатов, которые забрал другой инстанс
+        chat_links = list(chat_links)
+        if not chat_links:
+            return {}
+        rows = await execute_query(
+            f"SELECT chat_link, last_sent_at FROM destinations WHERE chat_link IN ({_placeholders(chat_links)})",
+            chat_links, fetch='all')
+        return {chat_link: last_sent.replace(tzinfo=timezone.utc).timestamp()
+                for chat_link, last_sent in rows or [] if last_sent is not None}
+
+    async def release(self, chat_links, sent_at=None):
+        # Время отправки пишется сразу вместе со снятием аренды, не дожидаясь WriteBuffer:
+        # иначе другой инстанс увидит свободный чат со старым last_sent_at и отправит повторно
+        chat_links = list(chat_links)
+        if not chat_links:
+            return
+        if sent_at is None:
+            await execute_query(
+                "UPDATE destinations SET lease_owner = NULL, lease_expires_at = NULL "
+                f"WHERE lease_owner = %s AND chat_link IN ({_placeholders(chat_links)})",
+                (self.instance_id, *chat_links))
+        else:
+            await execute_query(
+                "UPDATE destinations SET lease_owner = NULL, lease_expires_at = NULL, last_sent_at = %s "
+                f"WHERE lease_owner = %s AND chat_link IN ({_placeholders(chat_links)})",
+                (sent_at, self.instance_id, *chat_links))
+
+    async def release_all(self):
+        await execute_query(
+            "UPDATE destinations SET lease_owner = NULL, lease_expires_at = NULL WHERE lease_owner = %s",
+            (self.instance_id,))
+
+    async def renew(self, chat_links):
+        chat_links = list(chat_links)
+        if not chat_links:
+            return
+        await execute_query(
+            f"UPDATE destinations SET lease_expires_at = {dialect.shift(dialect.UTC_NOW, '%s')} "
+            f"WHERE lease_owner = %s AND chat_link IN ({_placeholders(chat_links)})",
+            (self.lease_seconds, self.instance_id, *chat_links))
+
+    async def _renew_loop(self, active_links):
+        while True:
+            await asyncio.sleep(max(1, self.lease_seconds // 3))
+            try:
+                await self.renew(active_links())
+            except Exception as e:
+                logger.error(f"Failed to renew leases of instance {self.instance_id}: {e}")
+
+    def start(self, active_links):
+        if self._task is None:
+            self._task = asyncio.create_task(self._renew_loop(active_links))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.release_all()
+        except Exception as e:
+            logger.error(f"Failed to release leases of instance {self.instance_id}: {e}")
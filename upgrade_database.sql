@@ -0,0 +1,22 @@
+-- Обновление базы, созданной по старой версии setup_database.sql.
+-- Выполняйте только те блоки, которых еще нет в вашей схеме.
+
+-- Время окончания FloodWait (UTC)
+ALTER TABLE accounts ADD COLUMN flood_until TIMESTAMP NULL DEFAULT NULL;
+
+-- Кэш резолва чатов и членства: выполните CREATE TABLE peer_cache из setup_database.sql
+
+-- id отправленного сообщения в чате-получателе
+ALTER TABLE history ADD COLUMN sent_message_id INT DEFAULT NULL AFTER source_message_id;
+
+-- Шардинг: аккаунт закрепляется за инстансом, чат арендуется инстансом на время рассылки
+ALTER TABLE accounts ADD COLUMN instance_id VARCHAR(64) NULL DEFAULT NULL;
+ALTER TABLE destinations ADD COLUMN lease_owner VARCHAR(64) NULL DEFAULT NULL;
+ALTER TABLE destinations ADD COLUMN lease_expires_at TIMESTAMP NULL DEFAULT NULL;
+
+-- Куда и из какого канала отправлен пост: защита от повторов и очистка старой истории
+ALTER TABLE history
+    ADD COLUMN destination VARCHAR(100) DEFAULT NULL,
+    ADD COLUMN source_chat_id BIGINT DEFAULT NULL,
+    ADD INDEX idx_history_destination (destination, source_message_id),
+    ADD INDEX idx_history_created_at (created_at);
@@ -0,0 +1,140 @@
+import asyncio
+from datetime import datetime, timezone
+
+from db import execute_query, execute_transaction, is_connection_error
+from env_loader import WRITE_BUFFER_SIZE, WRITE_FLUSH_INTERVAL
+from log_config import logger
+
+
+UPDATE_DESTINATION = ("UPDATE destinations SET last_msg_id = COALESCE(%s, last_msg_id), last_sent_at = %s "
+                      "WHERE chat_link = %s")
+INSERT_HISTORY = ("INSERT INTO history (source_message_id, account_id, status, sent_message_id, destination, "
+                  "source_chat_id) VALUES (%s, %s, %s, %s, %s, %s)")
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class WriteBuffer:
+    # Отложенная запись результатов рассылки: изменения копятся в памяти
+    # и уходят в БД одной транзакцией по размеру буфера или по таймеру.
+
+    def __init__(self, max_size=WRITE_BUFFER_SIZE, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._destinations = {}  # {chat_link: [last_msg_id, last_sent_at]}
+        self._history = []       # [(source_message_id, account_id, status, sent_message_id, destination, source_chat_id)]
+        self._flush_lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._destinations) + len(self._history)
+
+    def update_last_msg_id(self, chat_link, msg_id):
+        self._destinations[chat_link] = [msg_id, utc_now()]
+        self._check_size()
+
+    def update_last_sent_time(self, chat_link):
+        last_msg_id = self._destinations.get(chat_link, [None])[0]
+        self._destinations[chat_link] = [last_msg_id, utc_now()]
+        self._check_size()
+
+    def add_to_history(self, source_msg_id, account_id, status, sent_msg_id=None, destination=None,
+                       source_chat_id=None):
+        self._history.append((source_msg_id, account_id, status, sent_msg_id, destination, source_chat_id))
+        self._check_size()
+
+    def _check_size(self):
+        if len(self) >= self.max_size:
+            self._full.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not len(self):
+                return
+            destinations, self._destinations = self._destinations, {}
+            history, self._history = self._history, []
+
+            statements = []
+            if destinations:
+                statements.append((
+                    UPDATE_DESTINATION,
+                    [(msg_id, sent_at, chat_link) for chat_link, (msg_id, sent_at) in destinations.items()]
+                ))
+            if history:
+                statements.append((INSERT_HISTORY, history))
+
+            try:
+                await execute_transaction(statements)
+            except Exception as e:
+                logger.error(f"Write-behind flush failed ({len(destinations)} destinations, {len(history)} history rows): {e}")
+                if is_connection_error(e):
+                    self._requeue(destinations, history)
+                    raise
+                # Ошибка в данных: транзакция откатилась целиком, пишем поштучно и пропускаем битые строки
+                await self._write_one_by_one(destinations, history)
+
+    async def _write_one_by_one(self, destinations, history):
+        # Одна битая строка (например, history с удаленным аккаунтом) не должна блокировать все остальные
+        dropped = 0
+        for chat_link, (msg_id, sent_at) in list(destinations.items()):
+            try:
+                await execute_query(UPDATE_DESTINATION, (msg_id, sent_at, chat_link))
+            except Exception as e:
+                if is_connection_error(e):
+                    self._requeue(destinations, history)
+                    raise
+                dropped += 1
+                logger.error(f"Dropped destination update for {chat_link}: {e}")
+            del destinations[chat_link]
+
+        while history:
+            try:
+                await execute_query(INSERT_HISTORY, history[0])
+            except Exception as e:
+                if is_connection_error(e):
+                    self._requeue(destinations, history)
+                    raise
+                dropped += 1
+                logger.error(f"Dropped history row {history[0]}: {e}")
+            history.pop(0)
+
+        if dropped:
+            logger.warning(f"Write-behind flush: {dropped} row(s) dropped")
+
+    def _requeue(self, destinations, history):
+        # Возвращаем в буфер, не затирая более свежие значения
+        for chat_link, values in destinations.items():
+            self._destinations.setdefault(chat_link, values)
+        self._history[:0] = history
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(self.flush_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            pass